@@ -0,0 +1,30 @@
+"""5
+
+Revision ID: 8d3f0a6c2e15
+Revises: 5b2e9c7d1a40
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3f0a6c2e15'
+down_revision: Union[str, None] = '5b2e9c7d1a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # batch_alter_table: SQLite не умеет ALTER COLUMN, таблица пересоздаётся
+    with op.batch_alter_table('videos') as batch_op:
+        batch_op.alter_column('user_id', existing_type=sa.BigInteger(), nullable=True)
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM videos WHERE user_id IS NULL")
+    with op.batch_alter_table('videos') as batch_op:
+        batch_op.alter_column('user_id', existing_type=sa.BigInteger(), nullable=False)
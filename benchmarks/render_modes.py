@@ -0,0 +1,118 @@
+"""
+Сравнение стоимости рендера клипа: полное перекодирование с водяным знаком и без него (render_clip)
+против умной нарезки с перекодированием только граничных GOP (smart_render_clip, только для клипов без знака).
+
+Сегменты генерируются синтетически (ffmpeg testsrc2) с фиксированным GOP, как у камеры.
+CPU-секунды считаются по дочерним процессам ffmpeg (RUSAGE_CHILDREN).
+
+Запуск из корня репозитория:
+    python -m benchmarks.render_modes --runs 3 --size 1920x1080
+"""
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+# config.config требует эти переменные при импорте, для бенчмарка подойдут заглушки
+os.environ.setdefault("CAMERA_API_TOKEN", "0:benchmark")
+os.environ.setdefault("CAMERA_DATABASE_URL", "sqlite+aiosqlite://")
+
+from utils.cameras import render_clip, smart_render_clip  # noqa: E402
+from utils.segments import Segment  # noqa: E402
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def make_segments(workdir: Path, args) -> list[Segment]:
+    """Пишет синтетический буфер: сегменты по segment_time секунд, каждый начинается с ключевого кадра."""
+    gop_frames = int(round(args.gop * args.fps))
+    total = args.duration + 2 * args.segment_time
+    cmd = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={args.size}:rate={args.fps}",
+        "-t", str(total),
+        "-c:v", "libx264", "-preset", "veryfast", "-g", str(gop_frames), "-keyint_min", str(gop_frames),
+        "-sc_threshold", "0",
+        "-f", "segment", "-segment_time", str(args.segment_time), "-reset_timestamps", "1",
+        str(workdir / "buffer_0_%03d.mp4")
+    ]
+    proc = await asyncio.create_subprocess_exec(*cmd)
+    if await proc.wait() != 0:
+        raise RuntimeError("Не удалось сгенерировать сегменты")
+
+    paths = sorted(workdir.glob("buffer_0_*.mp4"))
+    now = time.time()
+    return [
+        Segment(path, i * args.segment_time, args.segment_time, now - (len(paths) - i - 1) * args.segment_time)
+        for i, path in enumerate(paths)
+    ]
+
+
+async def measure(name: str, render, runs: int) -> dict:
+    cpu, wall = [], []
+    for _ in range(runs):
+        cpu_before, wall_before = children_cpu(), time.perf_counter()
+        returncode, err = await render()
+        if returncode != 0:
+            raise RuntimeError(f"{name}: ffmpeg завершился с кодом {returncode}:\n{err}")
+        cpu.append(children_cpu() - cpu_before)
+        wall.append(time.perf_counter() - wall_before)
+    return {"name": name, "cpu": statistics.median(cpu), "wall": statistics.median(wall)}
+
+
+async def main(args):
+    height = int(args.size.split("x")[1])
+    watermark_file = "media/" + ("watermark_1080.png" if height >= 1080 else "watermark_720.png")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        segments = await make_segments(workdir, args)
+
+        # Окно клипа не совпадает с границами GOP, как в реальном сохранении
+        head = args.gop * 0.37
+        count = int((head + args.duration) // args.segment_time) + 1
+        clip_segments = segments[:count]
+        output = workdir / "clip.mp4"
+
+        results = [
+            await measure(
+                "full (libx264 veryfast + watermark)",
+                lambda: render_clip(clip_segments, head, args.duration, watermark_file, output),
+                args.runs
+            ),
+            await measure(
+                "full (libx264 veryfast, no watermark)",
+                lambda: render_clip(clip_segments, head, args.duration, None, output),
+                args.runs
+            ),
+            await measure(
+                "smart (boundary GOPs only)",
+                lambda: smart_render_clip(clip_segments, head, args.duration, args.gop, "h264", output),
+                args.runs
+            ),
+        ]
+
+    print(f"Клип {args.duration} сек., {args.size}@{args.fps}, GOP {args.gop} сек., прогонов: {args.runs}")
+    print(f"{'режим':<40}{'CPU, сек':>12}{'wall, сек':>12}")
+    for result in results:
+        print(f"{result['name']:<40}{result['cpu']:>12.2f}{result['wall']:>12.2f}")
+    # Умная нарезка применяется только к клипам без водяного знака, сравниваем с ними же
+    print(f"Экономия CPU: {results[1]['cpu'] / max(results[2]['cpu'], 1e-6):.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=60, help="длительность клипа, сек.")
+    parser.add_argument("--size", default="1920x1080")
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--gop", type=float, default=2, help="длительность GOP, сек.")
+    parser.add_argument("--segment-time", type=float, default=6, help="длительность сегмента (кратна GOP), сек.")
+    parser.add_argument("--runs", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,179 @@
+"""
+Сквозной бенчмарк сохранения клипа: start_buffer пишет буфер с синтетической RTSP-камеры,
+save_video вызывается с заданной параллельностью, по каждой фазе считаются p50/p95/p99.
+
+Источник - ffmpeg testsrc2, публикуемый в локальный RTSP-сервер (например, mediamtx).
+Сервер можно запустить самому или передать путь к бинарнику через --rtsp-server.
+
+Фазы:
+    probe  - get_stream_info (параметры потока для водяного знака);
+    queue  - ожидание в очереди кодирования;
+    render - выбор сегментов, склейка и кодирование (render_window);
+    total  - весь save_video.
+
+Запуск из корня репозитория:
+    python -m benchmarks.save_latency --rtsp-server ./mediamtx --clips 20 --concurrency 4
+"""
+import argparse
+import asyncio
+import os
+import resource
+import signal
+import time
+from types import SimpleNamespace
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rtsp-host", default="127.0.0.1")
+    parser.add_argument("--rtsp-port", type=int, default=8554)
+    parser.add_argument("--rtsp-server", help="путь к RTSP-серверу, который нужно запустить (например, mediamtx)")
+    parser.add_argument("--no-publish", action="store_true", help="не публиковать testsrc2, поток уже есть на сервере")
+    parser.add_argument("--size", default="1920x1080")
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--gop", type=float, default=2, help="GOP синтетической камеры, сек.")
+    parser.add_argument("--clips", type=int, default=12, help="сколько клипов сохранить")
+    parser.add_argument("--concurrency", type=int, default=1, help="сколько сохранений запускать одновременно")
+    parser.add_argument("--coalesce", action="store_true", help="разрешить объединение одновременных сохранений")
+    parser.add_argument("--render-mode", choices=("full", "smart"), default="full")
+    parser.add_argument("--no-watermark", action="store_true", help="сохранять клипы без водяного знака")
+    parser.add_argument("--prerender", action="store_true")
+    return parser.parse_args()
+
+
+args = parse_args()
+
+# Настройки, которые config.config читает при импорте
+os.environ.setdefault("CAMERA_API_TOKEN", "0:benchmark")
+os.environ.setdefault("CAMERA_DATABASE_URL", "sqlite+aiosqlite://")
+os.environ["CAMERA_RENDER_MODE"] = args.render_mode
+os.environ["CAMERA_PRERENDER"] = "1" if args.prerender else "0"
+if not args.coalesce:
+    os.environ["CAMERA_COALESCE_WINDOW"] = "-1"
+
+import utils.cameras as cameras  # noqa: E402
+from config.config import CUT_DURATION, PID_DIR  # noqa: E402
+from utils.segments import get_segments  # noqa: E402
+
+CAMERA_ID = 0
+phases: dict[str, list[float]] = {"probe": [], "queue": [], "render": [], "total": []}
+# Начало и конец рендера по пути выходного файла: рендер идёт в воркере очереди, а не в задаче запроса
+render_windows: dict = {}
+
+
+def timed_probe(func):
+    async def wrapper(*a, **kw):
+        started = time.perf_counter()
+        try:
+            return await func(*a, **kw)
+        finally:
+            phases["probe"].append(time.perf_counter() - started)
+    return wrapper
+
+
+def timed_render(func):
+    async def wrapper(camera_id, end, output_path, watermark=True):
+        started = time.perf_counter()
+        try:
+            return await func(camera_id, end, output_path, watermark)
+        finally:
+            render_windows[output_path] = (started, time.perf_counter())
+    return wrapper
+
+
+# Функции вызываются внутри utils.cameras по имени модуля, поэтому достаточно подменить атрибуты
+cameras.get_stream_info = timed_probe(cameras.get_stream_info)
+cameras.render_window = timed_render(cameras.render_window)
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(round(q / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def children_usage() -> tuple[float, int]:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+
+async def spawn(*cmd) -> asyncio.subprocess.Process:
+    return await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+    )
+
+
+async def save_one(user_id: int):
+    started = time.perf_counter()
+    clip = await cameras.save_video(user_id, CAMERA_ID, None, watermark=not args.no_watermark)
+    finished = time.perf_counter()
+    if clip is None:
+        raise RuntimeError("save_video не вернул клип, подробности в logs/bot.log")
+    render_started, render_finished = render_windows[clip.path]
+    clip.release()
+    phases["total"].append(finished - started)
+    phases["queue"].append(max(render_started - started, 0.0))
+    phases["render"].append(render_finished - render_started)
+
+
+async def main():
+    processes = []
+    if args.rtsp_server:
+        processes.append(await spawn(args.rtsp_server))
+        await asyncio.sleep(2)
+
+    path = "cam/realmonitor"
+    if not args.no_publish:
+        gop_frames = int(round(args.gop * args.fps))
+        processes.append(await spawn(
+            "ffmpeg", "-re", "-f", "lavfi", "-i", f"testsrc2=size={args.size}:rate={args.fps}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
+            "-g", str(gop_frames), "-keyint_min", str(gop_frames), "-sc_threshold", "0",
+            "-f", "rtsp", "-rtsp_transport", "tcp", f"rtsp://{args.rtsp_host}:{args.rtsp_port}/{path}"
+        ))
+
+    camera = SimpleNamespace(id=CAMERA_ID, name="benchmark", login="bench", password="bench",
+                             ip=args.rtsp_host, port=args.rtsp_port)
+    buffer_task = asyncio.create_task(cameras.start_buffer(camera))
+
+    try:
+        # Ждём, пока буфер накопит хотя бы один полный клип
+        print(f"Заполняем буфер ({CUT_DURATION} сек.)...")
+        while sum(seg.duration for seg in get_segments(CAMERA_ID)) < CUT_DURATION + 1:
+            await asyncio.sleep(1)
+
+        cpu_before, _ = children_usage()
+        wall_before = time.perf_counter()
+        user_id = 0
+        while user_id < args.clips:
+            batch = range(user_id, min(user_id + args.concurrency, args.clips))
+            await asyncio.gather(*(save_one(i) for i in batch))
+            user_id = batch.stop
+        wall = time.perf_counter() - wall_before
+        cpu_after, children_rss = children_usage()
+    finally:
+        buffer_task.cancel()
+        pid_file = PID_DIR / f"ffmpeg_{CAMERA_ID}.pid"
+        if pid_file.exists():
+            try:
+                os.kill(int(pid_file.read_text()), signal.SIGINT)
+            except (ProcessLookupError, ValueError):
+                pass
+        for process in reversed(processes):
+            process.terminate()
+            await process.wait()
+
+    print(f"Клипов: {args.clips}, параллельно: {args.concurrency}, режим: {args.render_mode}, "
+          f"водяной знак: {not args.no_watermark}, предрендер: {args.prerender}, объединение: {args.coalesce}")
+    print(f"{'фаза':<10}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for phase, values in phases.items():
+        if values:
+            print(f"{phase:<10}{len(values):>6}{percentile(values, 50):>10.2f}"
+                  f"{percentile(values, 95):>10.2f}{percentile(values, 99):>10.2f}")
+    print(f"CPU на клип (процессы ffmpeg): {(cpu_after - cpu_before) / args.clips:.2f} сек.")
+    print(f"Пропускная способность: {args.clips / wall:.2f} клипов/сек.")
+    print(f"Пиковый RSS: бот {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} МБ, "
+          f"ffmpeg {children_rss / 1024:.0f} МБ")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -4,9 +4,10 @@ from datetime import datetime
 from pathlib import Path
 
 from aiogram import Dispatcher, Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from dotenv import load_dotenv
 from pyotp import TOTP
-from requests.auth import HTTPDigestAuth
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -16,8 +17,15 @@ API_TOKEN = os.getenv('CAMERA_API_TOKEN')
 DATABASE_URL = os.getenv('CAMERA_DATABASE_URL')
 STAND_VERSION = os.getenv('STAND_VERSION')  # тест или деплой
 
+# Каналы для клипов тревог первого регистратора (см. RECORDER_IP ниже), дальше - таблица alarm_targets
 SEND_CHANNELS = list(map(int, os.getenv('SEND_CHANNELS', '-1002654429486').split(",")))
 
+# Лимиты Telegram на отправку: сообщений в секунду на бота, интервал между сообщениями в один чат (сек.)
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 25))
+TELEGRAM_PRIVATE_INTERVAL = float(os.getenv('TELEGRAM_PRIVATE_INTERVAL', 1))
+TELEGRAM_GROUP_INTERVAL = float(os.getenv('TELEGRAM_GROUP_INTERVAL', 3))  # 20 сообщений в минуту
+TELEGRAM_SEND_ATTEMPTS = int(os.getenv('TELEGRAM_SEND_ATTEMPTS', 3))
+
 PID_DIR = Path("ffmpeg_pid")
 PID_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -26,12 +34,50 @@ CUT_DURATION = int(os.getenv('CAMERA_CUT_DURATION', BUFFER_DURATION))
 FPS = int(os.getenv('CAMERA_FPS', 25))
 SEGMENT_DIR = Path("segments")
 SEGMENT_DIR.mkdir(parents=True, exist_ok=True)
-SEGMENT_TIME = 5
+SEGMENT_TIME = 5  # Желаемая длительность сегмента, фактическая выравнивается по GOP камеры
+GOP_PROBE_SECONDS = int(os.getenv('CAMERA_GOP_PROBE_SECONDS', 6))  # 0 - не определять GOP
 SEGMENT_WRAP = int(round(BUFFER_DURATION / SEGMENT_TIME * 1.5))  # default = 18
 
+# Кодирование клипов: число одновременных ffmpeg-кодировщиков, потоки libx264 на каждый и предел очереди.
+# По умолчанию под кодирование отдаётся половина ядер, остальное - потокам захвата и боту.
+ENCODE_WORKERS = int(os.getenv('CAMERA_ENCODE_WORKERS', max(1, (os.cpu_count() or 2) // 4)))
+ENCODE_THREADS = int(os.getenv('CAMERA_ENCODE_THREADS', max(1, (os.cpu_count() or 2) // (2 * ENCODE_WORKERS))))
+ENCODE_QUEUE_LIMIT = int(os.getenv('CAMERA_ENCODE_QUEUE_LIMIT', 10))
+# Запросы с одной камеры, пришедшие в пределах этого окна (сек.), получают один общий рендер
+COALESCE_WINDOW = float(os.getenv('CAMERA_COALESCE_WINDOW', SEGMENT_TIME))
+# Фоновый рендер водяного знака для каждого закрытого сегмента: сохранение становится склейкой без перекодирования
+PRERENDER = os.getenv('CAMERA_PRERENDER', '0') == '1'
+# Рендер клипов без водяного знака: full - полное перекодирование,
+# smart - перекодируются только неполные GOP на границах клипа. Клипы с водяным знаком всегда перекодируются целиком
+# (или склеиваются из предрендера).
+RENDER_MODE = os.getenv('CAMERA_RENDER_MODE', 'full')
+# Накладывать ли водяной знак на клипы тревог (пользовательские сохранения - всегда с ним)
+ALARM_WATERMARK = os.getenv('CAMERA_ALARM_WATERMARK', '1') == '1'
+
+# Получение обновлений: polling (по умолчанию) или webhook - встроенный aiohttp-сервер.
+# В режиме webhook Telegram шлёт обновления на WEBHOOK_BASE_URL + WEBHOOK_PATH, прокси перед ботом
+# должен пробрасывать этот путь на WEBHOOK_HOST:WEBHOOK_PORT.
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL')  # Например, https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', 30))  # Сколько ждать начатые обновления при остановке
+
+# Собственный сервер Bot API (telegram-bot-api --local). Перед переключением бота на него нужно один раз
+# вызвать logOut у api.telegram.org. В локальном режиме клипы передаются путём к файлу (file://) без загрузки
+# по HTTP и с лимитом 2 ГБ вместо 50 МБ - сервер должен видеть SEGMENT_DIR по пути TELEGRAM_API_LOCAL_DIR.
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')  # Например, http://127.0.0.1:8081
+TELEGRAM_API_LOCAL = os.getenv('TELEGRAM_API_LOCAL', '0') == '1'
+TELEGRAM_API_LOCAL_DIR = Path(os.getenv('TELEGRAM_API_LOCAL_DIR', SEGMENT_DIR.resolve()))
+
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 30))  # Сколько секунд доверять кэшу пользователей
+
 LAST_RESTART = datetime.now()
 
 buffers: dict[int, deque] = {}
+prerendered_buffers: dict[int, deque] = {}
 totp_dict: dict[int, TOTP] = {}
 
 # Инициализация бота
@@ -39,7 +85,14 @@ if API_TOKEN is None:
     raise ValueError("API_TOKEN is not set")
 if DATABASE_URL is None:
     raise ValueError("DATABASE_URL is not set")
-bot = Bot(token=API_TOKEN)
+if BOT_MODE == 'webhook' and (WEBHOOK_BASE_URL is None or WEBHOOK_SECRET is None):
+    raise ValueError("WEBHOOK_BASE_URL and WEBHOOK_SECRET must be set in webhook mode")
+if TELEGRAM_API_URL:
+    bot = Bot(token=API_TOKEN, session=AiohttpSession(
+        api=TelegramAPIServer.from_base(TELEGRAM_API_URL, is_local=TELEGRAM_API_LOCAL)
+    ))
+else:
+    bot = Bot(token=API_TOKEN)
 dp = Dispatcher()
 
 # Этот параметр ставился во времена, когда функция захвата потока использовала opencv.
@@ -48,10 +101,18 @@ os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp"
 
 
 # Настройки регистратора
+# Регистраторы, их каналы и получатели тревог хранятся в БД (recorders, recorder_channels, alarm_targets).
+# Переменные ниже нужны только при первом запуске: если таблица recorders пуста, из них создаётся запись.
 recorder_ip = os.getenv('RECORDER_IP')  # IP-адрес регистратора
 recorder_username = os.getenv('RECORDER_USERNAME')     # Имя пользователя
 recorder_password = os.getenv('RECORDER_PASSWORD')  # Пароль
-recorder_auth = HTTPDigestAuth(recorder_username, recorder_password)
-print(recorder_auth)
+RECORDER_CHANNELS = int(os.getenv('RECORDER_CHANNELS', 3))  # Каналы 1..N, канал N пишется в камеру с id N
+ALARM_NOTIFY_CHATS = [int(chat) for chat in os.getenv('ALARM_NOTIFY_CHATS', '').split(",") if chat.strip()]
+ALARM_RELOAD_INTERVAL = int(os.getenv('ALARM_RELOAD_INTERVAL', 60))  # Как часто перечитывать регистраторы из БД, сек.
+RECORDER_CONCURRENCY = int(os.getenv('RECORDER_CONCURRENCY', 2))  # Одновременных поисков на регистраторе
+ALARM_POLL_INTERVAL = int(os.getenv('ALARM_POLL_INTERVAL', 10))  # Пауза между проверками канала, сек.
+# Подписка на события регистратора (eventManager.cgi). Опрос остаётся запасным вариантом при обрыве потока.
+ALARM_EVENT_STREAM = os.getenv('ALARM_EVENT_STREAM', '0') == '1'
+ALARM_EVENT_HEARTBEAT = int(os.getenv('ALARM_EVENT_HEARTBEAT', 5))
+ALARM_EVENT_DEBOUNCE = int(os.getenv('ALARM_EVENT_DEBOUNCE', 60))  # Повторные тревоги канала в этом окне игнорируются
 
-last_clusters = {}
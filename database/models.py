@@ -1,7 +1,10 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, BigInteger
+from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, Boolean, BigInteger, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
+# Связи загружаются лениво (lazy="select" по умолчанию). В асинхронной сессии обращение к незагруженной
+# связи - ошибка, поэтому запросы в database/queries.py сами указывают, какие связи им нужны.
+
 
 Base = declarative_base()
 
@@ -12,8 +15,8 @@ class Users(Base):
     access_level = Column(Integer, default=0)  # 0 - no access, 1 - view, 2 - save and view
     current_password = Column(String, nullable=True)
     selected_court_id = Column(Integer, ForeignKey('courts.id', onupdate='CASCADE'), nullable=True)
-    court = relationship('Courts', back_populates='users', lazy="selectin")
-    videos = relationship('Videos', back_populates='user', lazy="selectin")
+    court = relationship('Courts', back_populates='users')
+    videos = relationship('Videos', back_populates='user')
 
 
 class Videos(Base):
@@ -21,13 +24,21 @@ class Videos(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     video_id = Column(String, nullable=False)  # Telegram file ID
     description = Column(String, nullable=True)
-    timestamp = Column(DateTime, nullable=False)
-    user_id = Column(BigInteger, ForeignKey('users.id', onupdate='CASCADE'), nullable=False)
+    timestamp = Column(DateTime, nullable=False, index=True)
+    # Пусто у клипов тревог: их сохраняет регистратор, а не пользователь
+    user_id = Column(BigInteger, ForeignKey('users.id', onupdate='CASCADE'), nullable=True)
     court_id = Column(Integer, ForeignKey('courts.id', onupdate='CASCADE'), nullable=False)
     public = Column(Boolean, nullable=False, default=False)
 
-    user = relationship('Users', back_populates='videos', lazy="selectin")
-    court = relationship('Courts', back_populates='videos', lazy="selectin")
+    user = relationship('Users', back_populates='videos')
+    court = relationship('Courts', back_populates='videos')
+
+    __table_args__ = (
+        # Последнее видео пользователя и загрузка Users.videos
+        Index('ix_videos_user_id_timestamp', user_id, timestamp.desc()),
+        # Видео корта за период
+        Index('ix_videos_court_id_timestamp', court_id, timestamp),
+    )
 
 
 class Courts(Base):
@@ -36,9 +47,9 @@ class Courts(Base):
     name = Column(String, nullable=False, unique=True)
     totp_secret = Column(String, nullable=True)
 
-    users = relationship('Users', back_populates='court', lazy="selectin")
-    videos = relationship('Videos', back_populates='court', lazy="selectin")
-    cameras = relationship('Cameras', back_populates='court', lazy="selectin")
+    users = relationship('Users', back_populates='court')
+    videos = relationship('Videos', back_populates='court')
+    cameras = relationship('Cameras', back_populates='court')
 
 
 class Cameras(Base):
@@ -50,12 +61,70 @@ class Cameras(Base):
     ip = Column(String, nullable=False)
     port = Column(Integer, nullable=False)
     court_id = Column(Integer, ForeignKey('courts.id', onupdate='CASCADE'), nullable=False)
-    court = relationship('Courts', back_populates='cameras', lazy="selectin")
+    court = relationship('Courts', back_populates='cameras')
+    recorder_channels = relationship('RecorderChannels', back_populates='camera')
+
+
+class Recorders(Base):
+    __tablename__ = 'recorders'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False)
+    ip = Column(String, nullable=False, unique=True)
+    username = Column(String, nullable=False)
+    password = Column(String, nullable=False)
+    active = Column(Boolean, nullable=False, default=True)
+
+    channels = relationship('RecorderChannels', back_populates='recorder')
+    targets = relationship('AlarmTargets', back_populates='recorder')
+
+
+class RecorderChannels(Base):
+    __tablename__ = 'recorder_channels'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    recorder_id = Column(Integer, ForeignKey('recorders.id', onupdate='CASCADE', ondelete='CASCADE'), nullable=False)
+    channel = Column(Integer, nullable=False)  # Номер канала на регистраторе (с 1)
+    camera_id = Column(Integer, ForeignKey('cameras.id', onupdate='CASCADE'), nullable=True)  # Откуда резать клип
+
+    recorder = relationship('Recorders', back_populates='channels')
+    camera = relationship('Cameras', back_populates='recorder_channels')
+
+
+class AlarmTargets(Base):
+    __tablename__ = 'alarm_targets'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    recorder_id = Column(Integer, ForeignKey('recorders.id', onupdate='CASCADE', ondelete='CASCADE'), nullable=False)
+    chat_id = Column(BigInteger, nullable=False)
+    send_video = Column(Boolean, nullable=False, default=False)  # True - клип тревоги, False - текстовое уведомление
+
+    recorder = relationship('Recorders', back_populates='targets')
+
+
+class DailyCourtStats(Base):
+    # Сводка по дням и кортам, обновляется при каждой вставке в videos (см. database/rollup.py)
+    __tablename__ = 'daily_court_stats'
+    day = Column(Date, primary_key=True)
+    court_id = Column(Integer, ForeignKey('courts.id', onupdate='CASCADE', ondelete='CASCADE'), primary_key=True)
+    videos = Column(Integer, nullable=False, default=0)  # Все видео, включая клипы тревог
+    user_videos = Column(Integer, nullable=False, default=0)  # Сохранённые пользователями
+
+
+class AlarmCursors(Base):
+    __tablename__ = 'alarm_cursors'
+    recorder = Column(String, primary_key=True)  # Адрес регистратора
+    channel = Column(Integer, primary_key=True)
+    cluster = Column(Integer, nullable=True)  # Последний обработанный кластер AlarmLocal
+    start_time = Column(DateTime, nullable=True)  # Время начала этой тревоги по часам регистратора
+    pushed_at = Column(DateTime, nullable=True)  # Последняя тревога, пришедшая из потока событий
 
 
 TABLES = {
     'users': Users,
     'videos': Videos,
     'courts': Courts,
-    'cameras': Cameras
+    'cameras': Cameras,
+    'daily_court_stats': DailyCourtStats,
+    'alarm_cursors': AlarmCursors,
+    'recorders': Recorders,
+    'recorder_channels': RecorderChannels,
+    'alarm_targets': AlarmTargets
 }
\ No newline at end of file
@@ -1,12 +1,15 @@
 import logging
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, distinct
+from sqlalchemy import select, func, distinct, case
+from sqlalchemy.orm import selectinload, joinedload
 from pyotp import random_base32
 
 from utils import update_totp_dict
 from database.models import *
+from database.rollup import DIALECT_INSERTS
+from database.user_cache import CachedUser, user_cache
 
 logger = logging.getLogger(__name__)
 
@@ -30,42 +33,43 @@ async def get_count(session: AsyncSession, table: str) -> int:
     return result.scalar()
 
 
-async def get_videos_by_date_count(session: AsyncSession, without_admins: bool = False) -> int:
-    # Возвращает количество записанных сегодня видео
+async def get_today_stats(session: AsyncSession):
+    """
+    Все цифры /stats за сегодня одним запросом: видео и уникальные пользователи - всего и без учёта
+    админов (access_level >= 2), плюс общее число пользователей.
+    Клипы тревог (без user_id) входят только в общее число видео.
+    """
     today_start = datetime.combine(datetime.now().date(), time.min)
-    admin_ids = [
-        289208255,   # @zaicol
-        405773902,   # @rush_B
-        418845150,   # @bokoyoko
-        460205942,   # @matveishapilov
-        6761826627,  # @alex_bokoev
-    ]
-    select_statement = select(func.count()).select_from(Videos).where(Videos.timestamp >= today_start)
-
-    if without_admins:
-        select_statement = select_statement.where(Videos.user_id.notin_(admin_ids))
-
-    result = await session.execute(select_statement)
-    return result.scalar()
-
-
-async def get_distinct_users_today(session: AsyncSession, without_admins: bool = False) -> int:
-    today_start = datetime.combine(datetime.now().date(), time.min)
-
-    select_statement = select(func.count(distinct(Videos.user_id))).where(Videos.timestamp >= today_start)
+    not_admin = Users.access_level < 2
+    result = await session.execute(
+        select(
+            func.count(Videos.id).label('videos'),
+            func.count(distinct(Videos.user_id)).label('users'),
+            func.count(case((not_admin, Videos.id))).label('user_videos'),
+            func.count(distinct(case((not_admin, Videos.user_id)))).label('non_admin_users'),
+            select(func.count()).select_from(Users).scalar_subquery().label('all_users'),
+        )
+        .select_from(Videos)
+        .outerjoin(Users, Videos.user_id == Users.id)
+        .where(Videos.timestamp >= today_start)
+    )
+    return result.one()
 
-    if without_admins:
-        admin_ids = [
-            289208255,   # @zaicol
-            405773902,   # @rush_B
-            418845150,   # @bokoyoko
-            460205942,   # @matveishapilov
-            6761826627,  # @alex_bokoev
-        ]
-        select_statement = select_statement.where(Videos.user_id.notin_(admin_ids))
 
-    result = await session.execute(select_statement)
-    return result.scalar()
+async def get_daily_stats(session: AsyncSession, days: int):
+    # Видео по дням из сводки daily_court_stats: стоимость зависит от числа дней, а не от размера videos
+    since = datetime.now().date() - timedelta(days=days - 1)
+    result = await session.execute(
+        select(
+            DailyCourtStats.day,
+            func.sum(DailyCourtStats.videos).label('videos'),
+            func.sum(DailyCourtStats.user_videos).label('user_videos'),
+        )
+        .where(DailyCourtStats.day >= since)
+        .group_by(DailyCourtStats.day)
+        .order_by(DailyCourtStats.day)
+    )
+    return result.all()
 
 
 async def get_first(session: AsyncSession, table: str):
@@ -82,6 +86,17 @@ async def get_by_id(session: AsyncSession, table: str, record_id: int):
     return result.scalars().first()
 
 
+# get_user_with_court
+async def get_user_with_court(session: AsyncSession, user_id: int) -> Users | None:
+    # Пользователь с выбранным кортом и камерами корта - всё, что нужно для сохранения видео
+    result = await session.execute(
+        select(Users)
+        .where(Users.id == user_id)
+        .options(joinedload(Users.court).selectinload(Courts.cameras))
+    )
+    return result.scalars().first()
+
+
 async def get_by_name(session: AsyncSession, table: str, name: str):
     model = get_model(table)
     result = await session.execute(
@@ -130,6 +145,42 @@ async def check_and_create_user(local_session: AsyncSession, user_id: int, acces
     return user
 
 
+# upsert_user
+
+async def upsert_user(local_session: AsyncSession, user_id: int, access_level: int = 1) -> Users:
+    """
+    Загружает пользователя, создавая его при необходимости, одним INSERT ... ON CONFLICT DO UPDATE RETURNING:
+    холостое обновление (id = excluded.id) заставляет RETURNING вернуть и уже существующую строку.
+    Транзакция сразу завершается, чтобы строка пользователя не оставалась заблокированной на время обработки.
+    """
+    insert = DIALECT_INSERTS.get(local_session.bind.dialect.name)
+    if insert is None:
+        return await check_and_create_user(local_session, user_id, access_level)
+
+    statement = insert(Users).values(id=user_id, access_level=access_level)
+    result = await local_session.execute(
+        statement
+        .on_conflict_do_update(index_elements=[Users.id], set_={'id': statement.excluded.id})
+        .returning(Users)
+    )
+    user = result.scalars().one()
+    await local_session.commit()
+    return user
+
+
+# get_cached_user
+async def get_cached_user(local_session: AsyncSession, user_id: int) -> CachedUser:
+    """
+    Снимок пользователя для проверок доступа: пока он свежий в кэше, БД не нужна; иначе - upsert_user.
+    Хэндлер, который меняет пользователя, загружает строку сам (get_by_id) - запись сбросит снимок в кэше.
+    """
+    user = user_cache.get(user_id)
+    if user is None:
+        user = CachedUser.from_row(await upsert_user(local_session, user_id))
+        user_cache.put(user)
+    return user
+
+
 # update_court_secret
 async def update_court_secret(local_session: AsyncSession, court_input: Courts):
     court = court_input
@@ -149,23 +200,15 @@ async def update_all_courts_secret(local_session: AsyncSession):
 
 # get_last_video
 async def get_last_video(local_session: AsyncSession, user_id: int) -> Videos | None:
-    result = await local_session.execute(
-        select(Users).where(Users.id == user_id)
-    )
-    user = result.scalars().first()
-
-    if not user:
-        return None
-
+    # Проверять пользователя отдельно не нужно: у несуществующего нет и видео.
+    # Запрос целиком отвечает индексом ix_videos_user_id_timestamp.
     result = await local_session.execute(
         select(Videos)
-        .where(Videos.user_id == user.id)
+        .where(Videos.user_id == user_id)
         .order_by(Videos.timestamp.desc())
         .limit(1)
     )
-    video = result.scalars().first()
-
-    return video
+    return result.scalars().first()
 
 
 # make_video_public
@@ -181,3 +224,45 @@ async def set_secret_for_all_courts(local_session: AsyncSession):
     for court in courts:
         if not court.totp_secret:
             await update_court_secret(local_session, court)
+
+
+# get_alarm_cursors
+async def get_alarm_cursors(local_session: AsyncSession, recorder: str) -> list[AlarmCursors]:
+    result = await local_session.execute(
+        select(AlarmCursors).where(AlarmCursors.recorder == recorder)
+    )
+    return result.scalars().all()
+
+
+# save_alarm_cursor
+async def save_alarm_cursor(local_session: AsyncSession, recorder: str, channel: int, **kwargs) -> None:
+    # merge сам выбирает между INSERT и UPDATE по первичному ключу (recorder, channel)
+    await local_session.merge(AlarmCursors(recorder=recorder, channel=channel, **kwargs))
+    await local_session.commit()
+
+
+# get_active_recorders
+async def get_active_recorders(local_session: AsyncSession) -> list[Recorders]:
+    result = await local_session.execute(
+        select(Recorders)
+        .where(Recorders.active.is_(True))
+        .order_by(Recorders.id)
+        .options(
+            selectinload(Recorders.channels).joinedload(RecorderChannels.camera),
+            selectinload(Recorders.targets),
+        )
+    )
+    return result.scalars().all()
+
+
+# seed_recorder
+async def seed_recorder(local_session: AsyncSession, name: str, ip: str, username: str, password: str,
+                        channels: dict[int, int | None], notify_chats: list[int], video_chats: list[int]) -> Recorders:
+    # Регистратор вместе с каналами (канал -> id камеры) и получателями тревог одной транзакцией
+    recorder = Recorders(name=name, ip=ip, username=username, password=password, active=True)
+    recorder.channels = [RecorderChannels(channel=channel, camera_id=camera_id) for channel, camera_id in channels.items()]
+    recorder.targets = [AlarmTargets(chat_id=chat_id, send_video=False) for chat_id in notify_chats] + \
+                       [AlarmTargets(chat_id=chat_id, send_video=True) for chat_id in video_chats]
+    local_session.add(recorder)
+    await local_session.commit()
+    return recorder
@@ -0,0 +1,39 @@
+from sqlalchemy import event, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database.models import Videos, DailyCourtStats
+
+# Варианты INSERT с ON CONFLICT для поддерживаемых диалектов
+DIALECT_INSERTS = {'postgresql': postgresql_insert, 'sqlite': sqlite_insert}
+
+
+# Счётчики обновляются в той же транзакции, что и вставка видео: сводка не расходится с videos
+@event.listens_for(Videos, "after_insert")
+def _count_video(mapper, connection, target: Videos) -> None:
+    day = target.timestamp.date()
+    user_videos = 1 if target.user_id is not None else 0
+    insert = DIALECT_INSERTS.get(connection.dialect.name)
+
+    if insert is not None:
+        statement = insert(DailyCourtStats).values(
+            day=day, court_id=target.court_id, videos=1, user_videos=user_videos
+        )
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[DailyCourtStats.day, DailyCourtStats.court_id],
+            set_={
+                'videos': DailyCourtStats.videos + 1,
+                'user_videos': DailyCourtStats.user_videos + user_videos,
+            }
+        ))
+        return
+
+    result = connection.execute(
+        update(DailyCourtStats)
+        .where(DailyCourtStats.day == day, DailyCourtStats.court_id == target.court_id)
+        .values(videos=DailyCourtStats.videos + 1, user_videos=DailyCourtStats.user_videos + user_videos)
+    )
+    if result.rowcount == 0:
+        connection.execute(DailyCourtStats.__table__.insert().values(
+            day=day, court_id=target.court_id, videos=1, user_videos=user_videos
+        ))
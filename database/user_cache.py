@@ -0,0 +1,77 @@
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from config.config import USER_CACHE_TTL
+from database.models import Users
+
+
+@dataclass(frozen=True, slots=True)
+class CachedUser:
+    """Поля пользователя, нужные для проверок доступа. Копия, а не объект сессии - её можно держать в памяти."""
+    id: int
+    access_level: int
+    selected_court_id: int | None
+    current_password: str | None
+
+    @classmethod
+    def from_row(cls, user: Users) -> "CachedUser":
+        return cls(user.id, user.access_level or 0, user.selected_court_id, user.current_password)
+
+
+class UserCache:
+    """
+    Кэш пользователей в памяти процесса с коротким TTL. Пока снимок свежий, DbSessionMiddleware отдаёт его
+    фильтрам и хэндлерам без запроса в БД.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._items: dict[int, tuple[float, CachedUser]] = {}
+
+    def get(self, user_id: int) -> CachedUser | None:
+        item = self._items.get(user_id)
+        if item is None:
+            return None
+        expires, user = item
+        if expires < time.monotonic():
+            del self._items[user_id]
+            return None
+        return user
+
+    def put(self, user: CachedUser) -> None:
+        self._items[user.id] = (time.monotonic() + self.ttl, user)
+
+    def invalidate(self, user_id: int) -> None:
+        self._items.pop(user_id, None)
+
+
+user_cache = UserCache(USER_CACHE_TTL)
+
+
+# Любая запись в users через ORM (создание пользователя, смена уровня доступа, корта или пароля)
+# сбрасывает его запись в кэше, без ручной инвалидации в каждом хэндлере. Сброс - после коммита:
+# до него другое обновление прочитало бы из БД старую строку и закэшировало её на весь TTL.
+_DIRTY_USERS = "dirty_user_ids"
+
+
+@event.listens_for(Users, "after_insert")
+@event.listens_for(Users, "after_update")
+@event.listens_for(Users, "after_delete")
+def _mark_user(mapper, connection, target: Users) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_DIRTY_USERS, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_users(session: Session) -> None:
+    for user_id in session.info.pop(_DIRTY_USERS, ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_users(session: Session) -> None:
+    session.info.pop(_DIRTY_USERS, None)
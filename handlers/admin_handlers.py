@@ -23,13 +23,11 @@ admin_router.message.filter(IsUserAdmin())
 
 
 @admin_router.message(Command("set_id"))
-async def cmd_set_id(message: types.Message):
-    user_id = message.from_user.id
-    async with AsyncSessionLocal() as session:
-        user = await check_and_create_user(session, user_id, 2)
-        user.access_level = 2
-        await session.commit()
-    await message.answer(f"Ваш ID: {user_id}\nВы добавлены как администратор (уровень доступа 2).")
+async def cmd_set_id(message: types.Message, session: AsyncSession, user: CachedUser):
+    db_user = await get_by_id(session, 'users', user.id)
+    db_user.access_level = 2
+    await session.commit()
+    await message.answer(f"Ваш ID: {user.id}\nВы добавлены как администратор (уровень доступа 2).")
 
 
 @admin_router.message(Command("help"))
@@ -47,41 +45,39 @@ async def cmd_add_court(message: types.Message, state: FSMContext):
 
 
 @admin_router.message(AddCourtFSM.input_court_name)
-async def process_input_court_name(message: types.Message, state: FSMContext):
+async def process_input_court_name(message: types.Message, state: FSMContext, session: AsyncSession):
     court_name = message.text
-    async with AsyncSessionLocal() as session:
-        try:
-            await create_item(
-                session, 'courts',
-                name=court_name,
-                secret=generate_password(),
-            )
-            await session.commit()
-        except Exception as e:
-            await message.answer(f"Произошла ошибка: {str(e)}")
-            logger.error(f"Ошибка добавления корта: {str(e)}", exc_info=True)
-            return
+    try:
+        await create_item(
+            session, 'courts',
+            name=court_name,
+            secret=generate_password(),
+        )
+        await session.commit()
+    except Exception as e:
+        await message.answer(f"Произошла ошибка: {str(e)}")
+        logger.error(f"Ошибка добавления корта: {str(e)}", exc_info=True)
+        return
     await message.answer(f"Корт '{court_name}' успешно добавлен.")
-    await send_courts_list(message)
+    await send_courts_list(message, session)
     await state.clear()
 
 
-async def send_courts_list(message: types.Message):
-    async with AsyncSessionLocal() as session:
-        result = await get_all(session, 'courts')
-        courts_list = result if isinstance(result, list) else await result.scalars().all()
+async def send_courts_list(message: types.Message, session: AsyncSession):
+    result = await get_all(session, 'courts')
+    courts_list = result if isinstance(result, list) else await result.scalars().all()
 
-        # Обновляем объекты в сессии (если нужно)
-        for court in courts_list:
-            await session.refresh(court)
+    # Обновляем объекты в сессии (если нужно)
+    for court in courts_list:
+        await session.refresh(court)
 
-        response = "Доступные корты:\nID - Название - Пароль\n"
-        for court in courts_list:
-            response += f"<code>{court.id}</code> - {court.name} - <code>{totp_dict[court.id].now()}</code>\n"
-        response += "\n\nДля удаления корта введите <code>/delete_court [ID корта]</code>\n"
-        response += "Для обновления пароля корта введите <code>/update_password [ID корта]</code>.\n"
-        response += "Для обновления всех паролей введите <code>/update_passwords</code>\n"
-        response += "Для получения паролей на сегодня введите <code>/show_passwords [ID корта]</code>"
+    response = "Доступные корты:\nID - Название - Пароль\n"
+    for court in courts_list:
+        response += f"<code>{court.id}</code> - {court.name} - <code>{totp_dict[court.id].now()}</code>\n"
+    response += "\n\nДля удаления корта введите <code>/delete_court [ID корта]</code>\n"
+    response += "Для обновления пароля корта введите <code>/update_password [ID корта]</code>.\n"
+    response += "Для обновления всех паролей введите <code>/update_passwords</code>\n"
+    response += "Для получения паролей на сегодня введите <code>/show_passwords [ID корта]</code>"
 
     await message.answer(response, parse_mode="HTML")
 
@@ -98,64 +94,60 @@ async def send_passwords_for_a_day(message: types.Message, court_id: int, court_
 
 
 @admin_router.message(Command("delete_court"))
-async def cmd_delete_court(message: types.Message):
+async def cmd_delete_court(message: types.Message, session: AsyncSession):
     parts = message.text.split()
     if len(parts) != 2 or not parts[1].isdigit():
         await message.answer("ID корта должен быть числом и указан.")
         return
     court_id = int(parts[1])
 
-    async with AsyncSessionLocal() as session:
-        is_deleted = await delete_item(session, 'courts', court_id)
-        if not is_deleted:
-            await message.answer("Корта с таким ID не существует.")
-            return
-        await session.commit()
+    is_deleted = await delete_item(session, 'courts', court_id)
+    if not is_deleted:
+        await message.answer("Корта с таким ID не существует.")
+        return
+    await session.commit()
 
     await message.answer(f"Корт с ID {court_id} успешно удален.")
-    await send_courts_list(message)
+    await send_courts_list(message, session)
 
 
 @admin_router.message(Command("update_passwords"))
-async def cmd_update_all_passwords(message: types.Message):
-    async with AsyncSessionLocal() as session:
-        await update_all_courts_secret(session)
-        await session.commit()
+async def cmd_update_all_passwords(message: types.Message, session: AsyncSession):
+    await update_all_courts_secret(session)
+    await session.commit()
 
     await message.answer(f"Пароли всех кортов успешно обновлены.")
-    await send_courts_list(message)
+    await send_courts_list(message, session)
 
 
 @admin_router.message(Command("update_password"))
-async def cmd_update_password(message: types.Message):
+async def cmd_update_password(message: types.Message, session: AsyncSession):
     parts = message.text.split()
     if len(parts) != 2 or not parts[1].isdigit():
         await message.answer("ID корта должен быть числом и указан.")
         return
     court_id = int(parts[1])
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(Courts).filter_by(id=court_id))
-        found_court = result.scalars().first()
-        if not found_court:
-            await message.answer("Корта с таким ID не существует.")
-            return
-        await update_court_secret(session, found_court)
-        await session.commit()
+    result = await session.execute(select(Courts).filter_by(id=court_id))
+    found_court = result.scalars().first()
+    if not found_court:
+        await message.answer("Корта с таким ID не существует.")
+        return
+    await update_court_secret(session, found_court)
+    await session.commit()
 
     await message.answer(
         f"Пароль корта {found_court.name} с ID {court_id} успешно обновлен."
     )
     await send_passwords_for_a_day(message, court_id, found_court.name)
-    await send_courts_list(message)
+    await send_courts_list(message, session)
 
 
 @admin_router.message(Command("show_passwords"))
-async def cmd_show_passwords(message: types.Message):
-    async with AsyncSessionLocal() as session:
-        if await get_count(session, 'courts') == 1:
-            court = await get_first(session, 'courts')
-            return await send_passwords_for_a_day(message, court.id, court.name)
+async def cmd_show_passwords(message: types.Message, session: AsyncSession):
+    if await get_count(session, 'courts') == 1:
+        court = await get_first(session, 'courts')
+        return await send_passwords_for_a_day(message, court.id, court.name)
 
     parts = message.text.split()
     if len(parts) != 2 or not parts[1].isdigit():
@@ -163,40 +155,37 @@ async def cmd_show_passwords(message: types.Message):
         return
     court_id = int(parts[1])
 
-    async with AsyncSessionLocal() as session:
-        found_court = await get_by_id(session, 'courts', court_id)
-        if not found_court:
-            await message.answer("Корта с таким ID не существует.")
-            return
+    found_court = await get_by_id(session, 'courts', court_id)
+    if not found_court:
+        await message.answer("Корта с таким ID не существует.")
+        return
 
     await send_passwords_for_a_day(message, court_id, found_court.name)
 
 
 @admin_router.message(DeleteCourtFSM.input_court_id)
-async def process_input_court_id(message: types.Message):
+async def process_input_court_id(message: types.Message, session: AsyncSession):
     court_id = message.text
-    async with AsyncSessionLocal() as session:
-        is_court_deleted = await delete_item(session, 'courts', int(court_id))
-        if not is_court_deleted:
-            await message.answer("Корта с таким ID не существует.")
-            return
-        await session.commit()
+    is_court_deleted = await delete_item(session, 'courts', int(court_id))
+    if not is_court_deleted:
+        await message.answer("Корта с таким ID не существует.")
+        return
+    await session.commit()
     await message.answer(f"Корт с ID {court_id} успешно удален.")
-    await send_courts_list(message)
+    await send_courts_list(message, session)
 
 
 @admin_router.message(Command("show_courts"))
 @admin_router.message(Command("show_courts"), SetupFSM.select_court)
-async def cmd_show_courts(message: types.Message):
-    await send_courts_list(message)
+async def cmd_show_courts(message: types.Message, session: AsyncSession):
+    await send_courts_list(message, session)
 
 
 # Работа с камерами
 @admin_router.message(Command("show_cameras"))
-async def cmd_show_cameras(message: types.Message):
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(Cameras))
-        cameras_list = result.scalars().all()
+async def cmd_show_cameras(message: types.Message, session: AsyncSession):
+    result = await session.execute(select(Cameras))
+    cameras_list = result.scalars().all()
     response = "Список камер:\n"
     for camera in cameras_list:
         response += f"{camera.id} - {camera.name}\n"
@@ -210,21 +199,19 @@ async def cmd_show_cameras(message: types.Message):
 
 
 @admin_router.message(AddCameraFSM.input_camera_name)
-async def process_input_camera_name(message: types.Message, state: FSMContext):
+async def process_input_camera_name(message: types.Message, state: FSMContext, session: AsyncSession):
     camera_name = message.text
     new_camera = Cameras(name=camera_name)
-    async with AsyncSessionLocal() as session:
-        session.add(new_camera)
-        await session.commit()
+    session.add(new_camera)
+    await session.commit()
     await message.answer(f"Камера '{camera_name}' успешно добавлена.")
-    await send_cameras_list(message)
+    await send_cameras_list(message, session)
     await state.clear()
 
 
-async def send_cameras_list(message: types.Message):
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(Cameras))
-        cameras_list = result.scalars().all()
+async def send_cameras_list(message: types.Message, session: AsyncSession):
+    result = await session.execute(select(Cameras))
+    cameras_list = result.scalars().all()
 
     response = "Список камер:\n"
     for camera in cameras_list:
@@ -259,29 +246,28 @@ async def cmd_logs(message: types.Message):
 
 
 @admin_router.message(Command("stats"))
-async def cmd_stats(message: types.Message):
-    async with AsyncSessionLocal() as session:
-        videos_count = await get_videos_by_date_count(session)
-        only_user_videos_count = await get_videos_by_date_count(session, True)
-        users_today_count = await get_distinct_users_today(session)
-        only_users_today_count = await get_distinct_users_today(session, True)
-        users_count = await get_count(session, 'users')
+async def cmd_stats(message: types.Message, session: AsyncSession):
+    today = await get_today_stats(session)
+    week = await get_daily_stats(session, 7)
+    week_counts = {row.day: row.videos for row in week}
+    week_days = [datetime.now().date() - timedelta(days=i) for i in range(6, -1, -1)]
 
     response = (
         "📊 <b>Статистика за сегодня:</b>\n"
-        f"👥 Пользователей: <b>{users_today_count}</b>\n"
-        f"🎥 Видео: <b>{videos_count}</b>\n\n"
+        f"👥 Пользователей: <b>{today.users}</b>\n"
+        f"🎥 Видео: <b>{today.videos}</b>\n\n"
         "🔒 <b>Без учёта админов:</b>\n"
-        f"👤 Пользователей: <b>{only_users_today_count}</b>\n"
-        f"📽️ Видео: <b>{only_user_videos_count}</b>\n\n"
-        f"🌐 Общее число пользователей: <b>{users_count}</b>\n"
+        f"👤 Пользователей: <b>{today.non_admin_users}</b>\n"
+        f"📽️ Видео: <b>{today.user_videos}</b>\n\n"
+        f"📈 Видео за 7 дней: <b>{' / '.join(str(week_counts.get(day, 0)) for day in week_days)}</b>\n"
+        f"🌐 Общее число пользователей: <b>{today.all_users}</b>\n"
         f"♻️ Последний перезапуск бота: <b>{LAST_RESTART.strftime('%Y-%m-%d %H:%M:%S')}</b>"
     )
     await message.answer(response, parse_mode="HTML")
 
 
 @admin_router.message(Command("check_connection"))
-async def cmd_check_connection(message: types.Message):
+async def cmd_check_connection(message: types.Message, session: AsyncSession):
     timeout = message.text.split()[1] if len(message.text.split()) > 1 else 5
     try:
         timeout = int(timeout)
@@ -292,15 +278,16 @@ async def cmd_check_connection(message: types.Message):
     await message.answer(f"Проверка подключения к потокам (таймаут: {timeout} сек.)...")
     result_message = "Результаты:\n"
     try:
-        async with AsyncSessionLocal() as session:
-            cameras = await get_all(session, 'cameras')
-            tasks = [check_rtsp_connection(camera, timeout) for camera in cameras]
-            results = await asyncio.gather(*tasks)
-            for camera, result in zip(cameras, results):
-                if result:
-                    result_message += f"{camera.name} - ✅\n"
-                else:
-                    result_message += f"{camera.name} - ❌\n"
+        cameras = await get_all(session, 'cameras')
+        # Проверка идёт до timeout секунд: завершаем транзакцию чтения, чтобы сессия не держала соединение из пула
+        await session.commit()
+        tasks = [check_rtsp_connection(camera, timeout) for camera in cameras]
+        results = await asyncio.gather(*tasks)
+        for camera, result in zip(cameras, results):
+            if result:
+                result_message += f"{camera.name} - ✅\n"
+            else:
+                result_message += f"{camera.name} - ❌\n"
 
         await message.answer(result_message)
     except Exception as e:
@@ -1,10 +1,11 @@
 from aiogram import types, Router
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from handlers.start_handler import cmd_start
 
 default_router = Router()
 
 
 @default_router.message()
-async def default_handler(message: types.Message, state: FSMContext):
-    await cmd_start(message, state)
+async def default_handler(message: types.Message, state: FSMContext, session: AsyncSession):
+    await cmd_start(message, state, session)
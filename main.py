@@ -4,14 +4,19 @@ import os
 from pyotp import TOTP
 from database import AsyncSessionLocal, init_models, engine, Cameras, get_all, Courts, set_secret_for_all_courts
 from handlers import start_router, admin_router, user_router, default_router
-from config.config import bot, dp, totp_dict, recorder_ip, recorder_auth, BUFFER_DURATION, CUT_DURATION, SEGMENT_WRAP, \
-    SEGMENT_TIME
+from config.config import bot, dp, totp_dict, BUFFER_DURATION, CUT_DURATION, SEGMENT_WRAP, SEGMENT_TIME, BOT_MODE
 from utils import setup_logger
-from utils.cameras import start_buffer, check_alarm_cycle
+from utils.alarms import alarm_supervisor
+from utils.cameras import start_buffer
+from utils.middlewares import DbSessionMiddleware
+from utils.webhook import run_webhook
 
 # Настройка логгера
 logger = setup_logger()
 
+# Одна сессия БД и загруженный пользователь на каждое обновление
+dp.update.outer_middleware(DbSessionMiddleware())
+
 # Регистрация хэндлеров
 dp.include_router(start_router)
 dp.include_router(admin_router)
@@ -41,10 +46,15 @@ async def main():
     for court in courts:
         totp_dict[court.id] = TOTP(court.totp_secret, interval=3600, digits=4)
 
-    asyncio.create_task(check_alarm_cycle(recorder_ip, recorder_auth, bot, 3))
+    asyncio.create_task(alarm_supervisor(bot))
 
     # Запуск бота
-    await dp.start_polling(bot)
+    if BOT_MODE == 'webhook':
+        await run_webhook(dp, bot)
+    else:
+        # Если раньше бот работал через вебхук, getUpdates без его удаления вернёт конфликт
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
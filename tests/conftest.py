@@ -0,0 +1,44 @@
+"""
+Общие настройки тестов. Зависимости сверх requirements.txt: pytest, pytest-asyncio.
+
+config.config читает окружение при импорте, поэтому переменные выставляются до импорта модулей бота.
+База - SQLite в памяти: для aiosqlite SQLAlchemy держит одно соединение на весь engine.
+"""
+import asyncio
+import os
+import socket
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+os.environ.setdefault("CAMERA_API_TOKEN", "123456:test")
+os.environ["CAMERA_DATABASE_URL"] = "sqlite+aiosqlite://"
+# Бот из config.config ходит в поддельный Bot API (tests/test_webhook.py), а не в api.telegram.org
+os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{free_port()}"
+os.environ["WEBHOOK_BASE_URL"] = "https://bot.example.com"
+os.environ["WEBHOOK_HOST"] = "127.0.0.1"
+os.environ["WEBHOOK_PORT"] = str(free_port())
+os.environ["WEBHOOK_SECRET"] = "test-secret"
+
+import pytest  # noqa: E402
+
+from database import engine, init_models  # noqa: E402
+
+
+@pytest.fixture
+async def db():
+    """Чистая схема на тест. Соединение закрывается вместе с event loop теста - следующий тест начнёт с пустой базы."""
+    await init_models(engine)
+    yield engine
+    await engine.dispose()
+
+
+async def wait_until(condition, timeout: float = 3) -> None:
+    """Ждёт, пока condition() станет истинным; по истечении timeout - TimeoutError."""
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
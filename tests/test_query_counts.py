@@ -0,0 +1,151 @@
+"""
+Число SQL-запросов на горячих путях обновления. Связи моделей загружаются лениво, поэтому лишний
+запрос появляется незаметно (новое поле в хэндлере, потерянный selectinload) - тесты фиксируют бюджет.
+"""
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from pyotp import TOTP, random_base32
+from sqlalchemy import event
+
+import handlers.user_handlers as user_handlers
+from config.config import totp_dict
+from database import AsyncSessionLocal, Cameras, Courts, Users, create_item
+from database.user_cache import user_cache
+from handlers.admin_handlers import cmd_stats
+from utils.filters import IsUserAdmin
+from utils.middlewares import DbSessionMiddleware
+
+
+class FakeMessage:
+    def __init__(self, text: str, user_id: int):
+        self.text = text
+        self.from_user = SimpleNamespace(id=user_id)
+        self.chat = SimpleNamespace(id=user_id)
+        self.answers: list[str] = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+
+class FakeState:
+    def __init__(self):
+        self.state = None
+
+    async def set_state(self, state):
+        self.state = state
+
+    async def clear(self):
+        self.state = None
+
+
+@pytest.fixture
+def statements(db):
+    """Список SQL-запросов, выполненных через engine с момента подключения фикстуры."""
+    executed: list[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(db.sync_engine, "before_cursor_execute", before_cursor_execute)
+    user_cache._items.clear()
+    yield executed
+    event.remove(db.sync_engine, "before_cursor_execute", before_cursor_execute)
+    user_cache._items.clear()
+
+
+async def run_middleware(user_id: int, handler) -> None:
+    async def call(event, data):
+        return await handler(data)
+
+    await DbSessionMiddleware()(call, SimpleNamespace(), {"event_from_user": SimpleNamespace(id=user_id)})
+
+
+async def test_admin_filter_new_user(statements):
+    results = []
+
+    async def handler(data):
+        results.append(await IsUserAdmin()(FakeMessage("/help", 1), data["user"]))
+
+    await run_middleware(1, handler)
+    # Новый пользователь - один INSERT ... ON CONFLICT DO UPDATE RETURNING
+    assert len(statements) == 1
+    assert results == [False]
+
+
+async def test_admin_filter_known_user(statements):
+    async with AsyncSessionLocal() as session:
+        session.add(Users(id=2, access_level=2))
+        await session.commit()
+    user_cache._items.clear()
+    statements.clear()
+    results = []
+
+    async def handler(data):
+        results.append(await IsUserAdmin()(FakeMessage("/help", 2), data["user"]))
+
+    await run_middleware(2, handler)
+    # Кэш пуст: один INSERT ... ON CONFLICT DO UPDATE RETURNING
+    assert len(statements) == 1
+
+    statements.clear()
+    await run_middleware(2, handler)
+    # Снимок в кэше: фильтр обходится без БД
+    assert statements == []
+    assert results == [True, True]
+
+
+async def test_stats(statements):
+    async with AsyncSessionLocal() as session:
+        session.add(Courts(id=1, name="Корт 1"))
+        session.add(Users(id=3, access_level=2))
+        await session.commit()
+        await create_item(session, 'videos', video_id="file", timestamp=datetime.now(), user_id=3, court_id=1)
+    statements.clear()
+
+    message = FakeMessage("/stats", 3)
+    async with AsyncSessionLocal() as session:
+        await cmd_stats(message, session)
+    # Цифры за сегодня и видео по дням за неделю
+    assert len(statements) == 2
+    assert "Видео: <b>1</b>" in message.answers[0]
+
+
+async def test_saverec(statements, monkeypatch):
+    totp = TOTP(random_base32())
+    monkeypatch.setitem(totp_dict, 1, totp)
+    async with AsyncSessionLocal() as session:
+        session.add(Courts(id=1, name="Корт 1"))
+        session.add_all([
+            Cameras(id=camera_id, name=f"Камера {camera_id}", login="admin", password="admin",
+                    ip="127.0.0.1", port=554, court_id=1)
+            for camera_id in (1, 2)
+        ])
+        session.add(Users(id=4, access_level=1, selected_court_id=1, current_password=totp.now()))
+        await session.commit()
+    statements.clear()
+
+    class FakeClip:
+        async def send(self, bot, chat_id):
+            return SimpleNamespace(video=SimpleNamespace(file_id="file"))
+
+        def release(self):
+            pass
+
+    async def save_video(user_id, camera_id, message):
+        assert camera_id == 1
+        return FakeClip()
+
+    monkeypatch.setattr(user_handlers, "save_video", save_video)
+    message = FakeMessage("/saverec", 4)
+
+    async def handler(data):
+        await user_handlers.cmd_saverec(message, FakeState(), data["session"], data["user"])
+
+    await run_middleware(4, handler)
+    # Пользователь (upsert при пустом кэше), пользователь с кортом, камеры корта,
+    # INSERT видео, сводка за день, refresh видео
+    assert len(statements) == 6
+    assert message.answers[0] == user_handlers.saving_video_text
+    assert message.answers[-1].startswith(user_handlers.make_public_text)
@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+from aiohttp import web
+
+from tests.conftest import wait_until
+import utils.alarms as alarms
+from utils.alarms import AlarmChannel, AlarmCursor, AlarmSite, check_alarm, listen_alarm_events, poll_channel, \
+    was_pushed
+from utils.recorder import EventStreamParser, RecorderClient
+
+USERNAME, PASSWORD, REALM, NONCE = "admin", "secret", "Login to test", "abc123"
+BOUNDARY = "myboundary"
+
+
+def part(body: str, content_length: bool = True) -> bytes:
+    headers = "Content-Type: text/plain\r\n"
+    if content_length:
+        headers += f"Content-Length: {len(body)}\r\n"
+    return f"--{BOUNDARY}\r\n{headers}\r\n{body}\r\n".encode()
+
+
+ALARM_START = "Code=AlarmLocal;action=Start;index=0"
+STREAM = part("Heartbeat") + part(ALARM_START) + part("Heartbeat", content_length=False) \
+    + part("Code=AlarmLocal;action=Stop;index=0")
+
+
+class FakeRecorder:
+    """
+    Регистратор на aiohttp: Digest-аутентификация (MD5, qop=auth), поиск mediaFileFind.cgi
+    и поток eventManager.cgi, который режет части на мелкие куски и держится до drop.
+    """
+
+    def __init__(self):
+        self.challenges = 0
+        self.find_requests = 0
+        self.stream_connections = 0
+        self.stream_events = [ALARM_START, ALARM_START]
+        self.items: list[str] = []  # Строки ответа findNextFile
+        self.drop = asyncio.Event()
+        self.app = web.Application(middlewares=[self.digest])
+        self.app.router.add_get("/cgi-bin/eventManager.cgi", self.event_manager)
+        self.app.router.add_get("/cgi-bin/mediaFileFind.cgi", self.media_file_find)
+        self.runner = web.AppRunner(self.app)
+        self.address = ""
+
+    async def start(self) -> None:
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = site._server.sockets[0].getsockname()[:2]
+        self.address = f"{host}:{port}"
+
+    async def stop(self) -> None:
+        self.drop.set()
+        await self.runner.cleanup()
+
+    @web.middleware
+    async def digest(self, request: web.Request, handler):
+        params = dict(
+            (key.strip(), value.strip().strip('"'))
+            for key, _, value in (item.partition("=") for item in
+                                  request.headers.get("Authorization", "").removeprefix("Digest ").split(","))
+        )
+        ha1 = hashlib.md5(f"{USERNAME}:{REALM}:{PASSWORD}".encode()).hexdigest()
+        ha2 = hashlib.md5(f"GET:{request.raw_path}".encode()).hexdigest()
+        expected = hashlib.md5(
+            f"{ha1}:{NONCE}:{params.get('nc')}:{params.get('cnonce')}:auth:{ha2}".encode()
+        ).hexdigest()
+        if params.get("uri") != request.raw_path or params.get("response") != expected:
+            self.challenges += 1
+            return web.Response(status=401, headers={
+                "WWW-Authenticate": f'Digest realm="{REALM}", qop="auth", nonce="{NONCE}", opaque="x"'
+            })
+        return await handler(request)
+
+    async def event_manager(self, request: web.Request) -> web.StreamResponse:
+        self.stream_connections += 1
+        response = web.StreamResponse(headers={"Content-Type": f"multipart/x-mixed-replace; boundary={BOUNDARY}"})
+        await response.prepare(request)
+        data = part("Heartbeat") + b"".join(part(body) for body in self.stream_events) + part("Heartbeat")
+        # Куски по 7 байт: граница, заголовки и тело части рвутся в произвольных местах
+        for offset in range(0, len(data), 7):
+            await response.write(data[offset:offset + 7])
+            await asyncio.sleep(0)
+        await self.drop.wait()
+        return response
+
+    async def media_file_find(self, request: web.Request) -> web.Response:
+        action = request.query["action"]
+        if action == "factory.create":
+            self.find_requests += 1
+            return web.Response(text="result=42\r\n")
+        if action == "findNextFile":
+            items, self.items = self.items, []
+            return web.Response(text=f"found={len(items)}\r\n" + "".join(line + "\r\n" for line in items))
+        return web.Response(text="OK\r\n")
+
+
+@pytest.fixture
+async def recorder():
+    fake = FakeRecorder()
+    await fake.start()
+    yield fake
+    await fake.stop()
+
+
+@pytest.fixture
+async def client(recorder):
+    client = RecorderClient(recorder.address, USERNAME, PASSWORD)
+    yield client
+    await client.close()
+
+
+@pytest.fixture
+def site(recorder):
+    alarms.alarm_cursors.clear()
+    return AlarmSite(
+        recorder_id=1, name="test", ip=recorder.address, username=USERNAME, password=PASSWORD,
+        channels=(AlarmChannel(1, None, None),), notify_chats=(), video_chats=(),
+    )
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 13, len(STREAM)])
+def test_parser_handles_split_chunks(size):
+    parser = EventStreamParser(f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+    events = []
+    for offset in range(0, len(STREAM), size):
+        events += parser.feed(STREAM[offset:offset + size])
+    # Часть без Content-Length отдаётся только когда пришла следующая граница
+    assert events == [
+        {"Code": "Heartbeat"},
+        {"Code": "AlarmLocal", "action": "Start", "index": "0"},
+        {"Code": "Heartbeat"},
+        {"Code": "AlarmLocal", "action": "Stop", "index": "0"},
+    ]
+
+
+async def test_stream_events_after_digest_challenge(recorder, client):
+    events = []
+    async for event in client.stream_events(["AlarmLocal"], heartbeat=1):
+        events.append(event)
+        if len(events) == 4:
+            break
+
+    assert [event["Code"] for event in events] == ["Heartbeat", "AlarmLocal", "AlarmLocal", "Heartbeat"]
+    assert recorder.challenges == 1
+
+    # nonce закэширован: следующий запрос проходит без повторного 401
+    status, text = await client.get("/cgi-bin/mediaFileFind.cgi?action=factory.create")
+    assert (status, text) == (200, "result=42")
+    assert recorder.challenges == 1
+
+
+async def test_polling_resumes_when_stream_drops(db, recorder, client, site, monkeypatch):
+    pushed = []
+
+    async def handle_pushed_alarm(site, channel, bot, pushed_at):
+        pushed.append((channel.channel, pushed_at))
+
+    monkeypatch.setattr(alarms, "handle_pushed_alarm", handle_pushed_alarm)
+    monkeypatch.setattr(alarms, "ALARM_POLL_INTERVAL", 0.05)
+    # События без номера канала пропускаются и не рвут поток
+    recorder.stream_events = ["Code=AlarmLocal;action=Start", "Code=AlarmLocal;action=Start;index=x",
+                              ALARM_START, ALARM_START]
+
+    events_connected = asyncio.Event()
+    alarm_tasks: set[asyncio.Task] = set()
+    tasks = [
+        asyncio.create_task(listen_alarm_events(client, site, None, events_connected, alarm_tasks)),
+        asyncio.create_task(poll_channel(client, site, site.channels[0], None, events_connected)),
+    ]
+    try:
+        await wait_until(events_connected.is_set)
+        await wait_until(lambda: pushed)
+        await asyncio.sleep(0.1)  # Проверка, начатая до подписки, успевает закончиться
+        polls = recorder.find_requests
+        await asyncio.sleep(0.3)
+        assert recorder.find_requests == polls, "пока поток жив, каналы не опрашиваются"
+        # Две тревоги канала подряд - одна обработка (ALARM_EVENT_DEBOUNCE)
+        assert [channel for channel, _ in pushed] == [1]
+        assert alarm_tasks == set()
+
+        recorder.drop.set()
+        await wait_until(lambda: not events_connected.is_set())
+        await wait_until(lambda: recorder.find_requests >= polls + 2)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_was_pushed():
+    pushed_at = datetime(2026, 1, 1, 12, 0, 0)
+    cursor = AlarmCursor(pushed_at=pushed_at)
+    assert was_pushed(cursor, pushed_at - timedelta(seconds=3))
+    assert not was_pushed(cursor, pushed_at + timedelta(seconds=alarms.ALARM_EVENT_DEBOUNCE + 1))
+    assert not was_pushed(cursor, None)
+    assert not was_pushed(AlarmCursor(), pushed_at)
+
+
+@pytest.mark.parametrize("delay, sent", [(2, False), (600, True)])
+async def test_poll_skips_alarm_already_pushed(db, recorder, client, site, monkeypatch, delay, sent):
+    calls = []
+
+    async def notify_alarm(site, text, bot):
+        calls.append(text)
+
+    async def save_and_send_video_to_channel(site, channel, bot, alarm_start_time):
+        calls.append(alarm_start_time)
+
+    monkeypatch.setattr(alarms, "notify_alarm", notify_alarm)
+    monkeypatch.setattr(alarms, "save_and_send_video_to_channel", save_and_send_video_to_channel)
+
+    pushed_at = datetime.now().replace(microsecond=0) - timedelta(minutes=2)
+    cursor = alarms.get_cursor(client.ip, 1)
+    cursor.cluster, cursor.pushed_at = 100, pushed_at
+    start_time = pushed_at - timedelta(seconds=delay)
+    recorder.items = [
+        "items[0].Cluster=101",
+        f"items[0].StartTime={start_time:%Y-%m-%d %H:%M:%S}",
+        "items[0].Events[0]=AlarmLocal",
+    ]
+
+    await check_alarm(client, site, site.channels[0], None)
+
+    assert (cursor.cluster, cursor.start_time) == (101, start_time)
+    assert bool(calls) is sent
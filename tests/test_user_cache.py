@@ -0,0 +1,38 @@
+from database import AsyncSessionLocal, Users, get_by_id, get_cached_user
+from database.user_cache import CachedUser, user_cache
+
+
+async def test_snapshot_dropped_after_commit(db):
+    user_cache._items.clear()
+    async with AsyncSessionLocal() as session:
+        old = await get_cached_user(session, 1)
+
+    async with AsyncSessionLocal() as session:
+        user = await get_by_id(session, 'users', 1)
+        user.access_level = 2
+        await session.flush()
+        # Другое обновление между flush и commit ещё видит старую строку и кладёт её в кэш
+        user_cache.put(old)
+        await session.commit()
+
+    assert user_cache.get(1) is None
+    async with AsyncSessionLocal() as session:
+        assert (await get_cached_user(session, 1)).access_level == 2
+    user_cache._items.clear()
+
+
+async def test_snapshot_kept_after_rollback(db):
+    user_cache._items.clear()
+    async with AsyncSessionLocal() as session:
+        session.add(Users(id=2, access_level=1))
+        await session.commit()
+        snapshot = CachedUser.from_row(await get_by_id(session, 'users', 2))
+        user_cache.put(snapshot)
+
+        user = await get_by_id(session, 'users', 2)
+        user.access_level = 2
+        await session.flush()
+        await session.rollback()
+
+    assert user_cache.get(2) == snapshot
+    user_cache._items.clear()
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import signal
+
+import aiohttp
+import pytest
+from aiogram import Dispatcher, Router
+from aiogram.types import Message
+from aiohttp import web
+from yarl import URL
+
+from config.config import bot, TELEGRAM_API_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
+from tests.conftest import wait_until
+from utils.webhook import InFlightUpdates, run_webhook
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1, "date": 0, "text": "привет",
+        "chat": {"id": 5, "type": "private"},
+        "from": {"id": 5, "is_bot": False, "first_name": "Тест"},
+    },
+}
+
+
+class FakeBotApi:
+    """Bot API на aiohttp по адресу TELEGRAM_API_URL: запоминает вызванные методы и на всё отвечает ok."""
+
+    def __init__(self):
+        self.methods: list[str] = []
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(self.app)
+
+    async def start(self) -> None:
+        url = URL(TELEGRAM_API_URL)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, url.host, url.port).start()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.methods.append(request.match_info["method"])
+        return web.json_response({"ok": True, "result": True})
+
+
+@pytest.fixture
+async def bot_api():
+    api = FakeBotApi()
+    await api.start()
+    yield api
+    await api.runner.cleanup()
+
+
+async def test_webhook_delivers_updates_and_drains_on_shutdown(bot_api):
+    started, release = asyncio.Event(), asyncio.Event()
+    events: list[str] = []
+    router = Router()
+
+    @router.message()
+    async def handler(message: Message):
+        events.append(f"handler:{message.text}")
+        started.set()
+        await release.wait()
+        events.append("handler done")
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    webhook = asyncio.create_task(run_webhook(dp, bot))
+    # Сигналы перехватываются после setWebhook: до этого SIGTERM остановил бы сам pytest
+    await wait_until(lambda: signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL)
+    assert bot_api.methods == ["setWebhook"]
+
+    url = f"http://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}"
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as response:
+            assert response.status == 403
+        async with session.post(url, json=UPDATE) as response:
+            assert response.status == 403
+        assert events == []
+
+        async with session.post(url, json=UPDATE,
+                                headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}) as response:
+            assert response.status == 200
+    await asyncio.wait_for(started.wait(), 3)
+
+    in_flight = next(m for m in dp.update.outer_middleware if isinstance(m, InFlightUpdates))
+    assert in_flight.count == 1
+
+    os.kill(os.getpid(), signal.SIGTERM)
+    await asyncio.sleep(0.2)
+    # Сервер уже не принимает запросы, но остановка ждёт начатое обновление
+    assert not webhook.done()
+    async with aiohttp.ClientSession() as session:
+        with pytest.raises(aiohttp.ClientConnectionError):
+            await session.post(url, json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET})
+
+    release.set()
+    await asyncio.wait_for(webhook, 3)
+    assert events == ["handler:привет", "handler done"]
+    assert in_flight.count == 0
+    # Обработчики сигналов сняты: SIGTERM снова останавливает процесс, а не старый stop
+    assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
+    # Вебхук при остановке не удаляется
+    assert "deleteWebhook" not in bot_api.methods
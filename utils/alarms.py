@@ -0,0 +1,449 @@
+import re
+import logging
+from datetime import timedelta
+import asyncio
+from dataclasses import dataclass
+
+from config.config import *
+from database import AsyncSessionLocal, Recorders, get_all, get_alarm_cursors, save_alarm_cursor, create_item, \
+    get_active_recorders, seed_recorder
+from utils.cameras import save_video
+from utils.encoder import PRIORITY_ALARM
+from utils.recorder import RecorderClient
+from utils.sender import sender
+
+logger = logging.getLogger(__name__)
+
+
+class AlarmSearchPage:
+    """
+    Потоковый разбор ответа findNextFile («items[0].Cluster=123», «items[0].Events[0]=AlarmLocal», ...).
+    Хранит только поля текущей записи и лучшую тревожную запись (самую позднюю, при равном времени -
+    с максимальным Cluster).
+    """
+    _ITEM_RE = re.compile(r'items\[(\d+)\]\.([^=]+)=(.+)')
+
+    def __init__(self, min_cluster: int | None = None, min_start_time: datetime | None = None):
+        # Запись новая, если её Cluster больше min_cluster или она началась позже min_start_time.
+        # Второе условие нужно, когда регистратор начал считать кластеры заново (замена или форматирование диска).
+        self.min_cluster = min_cluster
+        self.min_start_time = min_start_time.strftime("%Y-%m-%d %H:%M:%S") if min_start_time else None
+        self.items = 0
+        self.best_cluster: int | None = None
+        self.best_start_time: str | None = None
+        self._index = None
+        self._is_alarm = False
+        self._cluster = None
+        self._start_time = None
+
+    def feed(self, line: str) -> None:
+        match = self._ITEM_RE.match(line)
+        if not match:
+            return
+        index, key, value = match.groups()
+        if index != self._index:
+            self._finish_item()
+            self._index = index
+            self.items += 1
+
+        if key.startswith('Events') and value == 'AlarmLocal':
+            self._is_alarm = True
+        elif key == 'Cluster':
+            self._cluster = value
+        elif key == 'StartTime':
+            self._start_time = value
+
+    def close(self) -> None:
+        self._finish_item()
+
+    def _finish_item(self) -> None:
+        if self._is_alarm and self._cluster is not None:
+            try:
+                cluster = int(self._cluster)
+            except ValueError:
+                logger.error(f"Ошибка парсинга кластера: {self._cluster}")
+                cluster = None
+            start_time = self._start_time or ""
+            is_new = cluster is not None and (
+                self.min_cluster is None or cluster > self.min_cluster
+                or (self.min_start_time is not None and start_time > self.min_start_time)
+            )
+            # Время в формате «YYYY-MM-DD HH:MM:SS» сравнивается как строка
+            if is_new and (self.best_cluster is None
+                           or (start_time, cluster) > (self.best_start_time or "", self.best_cluster)):
+                self.best_cluster = cluster
+                self.best_start_time = self._start_time
+        self._is_alarm, self._cluster, self._start_time = False, None, None
+
+
+# --- Получение следующей порции видео ---
+async def get_next_videos(client: RecorderClient, object_id, min_cluster: int | None = None,
+                          min_start_time: datetime | None = None) -> AlarmSearchPage | None:
+    url = f"/cgi-bin/mediaFileFind.cgi?action=findNextFile&object={object_id}&count=100"
+    page = AlarmSearchPage(min_cluster, min_start_time)
+    try:
+        async for line in client.iter_lines(url):
+            page.feed(line)
+    except Exception as e:
+        logger.error(f"Ошибка при findNextFile: {e}")
+        return None
+    page.close()
+    return page
+
+
+async def destroy_find_object(client: RecorderClient, object_id):
+    url = f"/cgi-bin/mediaFileFind.cgi?action=factory.destroy&object={object_id}"
+    await client.get(url)
+
+
+# --- Получение последнего события AlarmLocal ---
+@dataclass
+class AlarmCursor:
+    """Последняя обработанная тревога канала: поиск продолжается с неё."""
+    cluster: int | None = None
+    start_time: datetime | None = None
+    pushed_at: datetime | None = None  # Последняя тревога из потока событий
+
+
+# Курсоры тревог по (адрес регистратора, канал). Хранятся в БД (alarm_cursors), чтобы после
+# перезапуска бота последняя тревога не считалась новой и не рендерилась повторно.
+alarm_cursors: dict[tuple[str, int], AlarmCursor] = {}
+
+
+async def load_alarm_cursors(recorder: str) -> None:
+    async with AsyncSessionLocal() as session:
+        rows = await get_alarm_cursors(session, recorder)
+    for row in rows:
+        alarm_cursors[(recorder, row.channel)] = AlarmCursor(row.cluster, row.start_time, row.pushed_at)
+        logger.info(f"Регистратор {recorder}, канал {row.channel} - курсор: кластер {row.cluster}, {row.start_time}")
+
+
+def get_cursor(recorder: str, channel) -> AlarmCursor:
+    return alarm_cursors.setdefault((recorder, channel), AlarmCursor())
+
+
+async def store_cursor(recorder: str, channel, cursor: AlarmCursor) -> None:
+    try:
+        async with AsyncSessionLocal() as session:
+            await save_alarm_cursor(session, recorder, channel, cluster=cursor.cluster,
+                                    start_time=cursor.start_time, pushed_at=cursor.pushed_at)
+    except Exception as e:
+        # Курсор в памяти уже обновлён, до перезапуска повторов не будет
+        logger.error(f"Регистратор {recorder}, канал {channel} - не удалось сохранить курсор: {e}")
+
+
+async def get_latest_alarm_local_video(client: RecorderClient, channel,
+                                       cursor: AlarmCursor | None = None) -> tuple[int | None, datetime | None]:
+    """
+    Возвращает кластер и время начала события AlarmLocal на канале, более нового, чем cursor.
+    Поиск идёт от времени курсора (но не дальше 10 минут назад) и останавливается на первой странице
+    с новой тревогой.
+    """
+    cursor = cursor or AlarmCursor()
+    end_time = datetime.now() + timedelta(minutes=5)
+    start_time = end_time - timedelta(minutes=15)
+    if cursor.start_time is not None and cursor.start_time > start_time:
+        start_time = cursor.start_time
+    start_time_str = start_time.strftime("%Y-%m-%d %H:%M:%S")
+    end_time_str = end_time.strftime("%Y-%m-%d %H:%M:%S")
+    storage_path = "/dev/sda"
+
+    # 1. Создание объекта поиска
+    create_url = "/cgi-bin/mediaFileFind.cgi?action=factory.create"
+    status, text = await client.get(create_url)
+    if status != 200:
+        logger.error("Ошибка создания объекта поиска: %s", text)
+        return None, None
+
+    object_id = text.split("=")[-1].strip()
+    logger.info(f"Channel: {channel}, Object ID: {object_id}")
+
+    # 2. Инициация поиска
+    start_find_url = (
+        f"/cgi-bin/mediaFileFind.cgi?action=findFile"
+        f"&object={object_id}"
+        f"&condition.Channel={channel}"
+        f"&condition.StartTime={start_time_str}"
+        f"&condition.EndTime={end_time_str}"
+        f"&condition.Dirs=n&condition.Dirs[0]={storage_path}"
+    )
+
+    status, text = await client.get(start_find_url)
+    if status != 200 or "false" in text:
+        logger.error("Ошибка начала поиска: %s", text)
+        await destroy_find_object(client, object_id)
+        return None, None
+
+    # 3. Получение видео с событиями
+    cluster = None
+    alarm_start_time = None
+    while True:
+        page = await get_next_videos(client, object_id, cursor.cluster, cursor.start_time)
+        if page is None or page.items == 0:
+            break
+
+        if page.best_cluster is None:
+            continue
+
+        cluster = page.best_cluster
+        if page.best_start_time is not None:
+            alarm_start_time = datetime.strptime(page.best_start_time, "%Y-%m-%d %H:%M:%S")
+        logger.info(f"Channel: {channel}, Cluster: {cluster}, StartTime: {page.best_start_time}")
+        break
+
+    await destroy_find_object(client, object_id)
+    return cluster, alarm_start_time
+
+
+@dataclass(frozen=True)
+class AlarmChannel:
+    channel: int                # Номер канала на регистраторе
+    camera_id: int | None       # Камера, из буфера которой режется клип (None - только уведомление)
+    court_id: int | None
+
+
+@dataclass(frozen=True)
+class AlarmSite:
+    """Настройки одного регистратора из БД. Если строки в БД поменялись, опросчик перезапускается."""
+    recorder_id: int
+    name: str
+    ip: str
+    username: str
+    password: str
+    channels: tuple[AlarmChannel, ...]
+    notify_chats: tuple[int, ...]
+    video_chats: tuple[int, ...]
+
+    @classmethod
+    def from_row(cls, recorder: Recorders) -> "AlarmSite":
+        return cls(
+            recorder_id=recorder.id, name=recorder.name, ip=recorder.ip,
+            username=recorder.username, password=recorder.password,
+            channels=tuple(
+                AlarmChannel(row.channel, row.camera_id, row.camera.court_id if row.camera else None)
+                for row in sorted(recorder.channels, key=lambda row: row.channel)
+            ),
+            notify_chats=tuple(target.chat_id for target in recorder.targets if not target.send_video),
+            video_chats=tuple(target.chat_id for target in recorder.targets if target.send_video),
+        )
+
+    def get_channel(self, channel: int) -> AlarmChannel | None:
+        return next((item for item in self.channels if item.channel == channel), None)
+
+
+async def notify_alarm(site: AlarmSite, text: str, bot):
+    for chat_id in site.notify_chats:
+        try:
+            await sender.send(chat_id, bot.send_message, text=text)
+        except Exception as e:
+            logger.error(f"Регистратор {site.name}: не удалось отправить уведомление в {chat_id}: {e}")
+
+
+def was_pushed(cursor: AlarmCursor, alarm_start_time: datetime | None) -> bool:
+    """Тревога уже обработана через поток событий (опрос нашёл ту же запись на регистраторе)."""
+    if cursor.pushed_at is None or alarm_start_time is None:
+        return False
+    return abs((alarm_start_time - cursor.pushed_at).total_seconds()) <= ALARM_EVENT_DEBOUNCE
+
+
+# --- Цикл проверки тревог ---
+async def check_alarm(client: RecorderClient, site: AlarmSite, channel: AlarmChannel, bot):
+    logger.info(f" {site.name}: проверка канала {channel.channel} ".center(80, '='))
+    cursor = get_cursor(client.ip, channel.channel)
+    # Поиск на регистраторе ограничен семафором клиента, обработка тревоги - уже нет
+    async with client.semaphore:
+        cluster, alarm_start_time = await get_latest_alarm_local_video(client, channel.channel, cursor)
+
+    if cluster is not None:
+        if cursor.cluster is not None and cluster <= cursor.cluster:
+            # Более поздняя тревога с меньшим кластером: счётчик регистратора начался заново, курсор сбрасывается
+            logger.warning(f"{site.name}: канал {channel.channel} - счётчик кластеров сброшен "
+                           f"({cursor.cluster} -> {cluster}), курсор начат заново")
+        cursor.cluster = cluster
+        cursor.start_time = alarm_start_time or cursor.start_time
+        # Курсор сохраняется до рендера: тревога, прерванная перезапуском, теряется, но не дублируется
+        await store_cursor(client.ip, channel.channel, cursor)
+        if was_pushed(cursor, alarm_start_time):
+            logger.info(f"{site.name}: канал {channel.channel} - кластер {cluster} уже обработан по потоку событий")
+        else:
+            await notify_alarm(site, f"Обнаружено событие в камере: {cluster} ({site.name}, канал {channel.channel})",
+                               bot)
+            await save_and_send_video_to_channel(site, channel, bot, alarm_start_time)
+
+    logger.info(f" {site.name}: канал {channel.channel} - последний кластер: {cursor.cluster} ".center(80, '='))
+
+
+async def poll_channel(client: RecorderClient, site: AlarmSite, channel: AlarmChannel, bot,
+                       events_connected: asyncio.Event):
+    """
+    Независимый цикл опроса одного канала: медленный канал не задерживает остальные.
+    Пока подписка на события регистратора жива, опрос не нужен.
+    """
+    while True:
+        if not events_connected.is_set():
+            try:
+                await check_alarm(client, site, channel, bot)
+            except Exception as e:
+                logger.error(f"{site.name}: канал {channel.channel} - ошибка проверки тревог: {e}", exc_info=True)
+        await asyncio.sleep(ALARM_POLL_INTERVAL)
+
+
+async def handle_pushed_alarm(site: AlarmSite, channel: AlarmChannel, bot, pushed_at: datetime):
+    try:
+        await notify_alarm(site, f"Обнаружено событие в камере: AlarmLocal ({site.name}, канал {channel.channel})", bot)
+        await save_and_send_video_to_channel(site, channel, bot, pushed_at)
+    except Exception as e:
+        logger.error(f"{site.name}: канал {channel.channel} - ошибка обработки тревоги: {e}", exc_info=True)
+
+
+async def listen_alarm_events(client: RecorderClient, site: AlarmSite, bot, events_connected: asyncio.Event,
+                              alarm_tasks: set[asyncio.Task]):
+    """
+    Держит подписку eventManager.cgi на AlarmLocal и реагирует на начало тревоги сразу.
+    При обрыве потока снимает events_connected - каналы возвращаются к опросу до переподключения.
+    Задачи обработки тревог складываются в alarm_tasks: их держит и завершает check_alarm_cycle.
+    """
+    while True:
+        try:
+            async for event in client.stream_events(["AlarmLocal"], heartbeat=ALARM_EVENT_HEARTBEAT):
+                if not events_connected.is_set():
+                    logger.info(f"Регистратор {site.name}: подписка на события активна, опрос приостановлен")
+                    events_connected.set()
+
+                if event.get("Code") != "AlarmLocal" or event.get("action") != "Start":
+                    continue
+                try:
+                    index = int(event["index"])
+                except (KeyError, ValueError):
+                    logger.warning(f"Регистратор {site.name}: событие без номера канала пропущено: {event}")
+                    continue
+                channel = site.get_channel(index + 1)
+                if channel is None:
+                    continue
+                now = datetime.now()
+                cursor = get_cursor(client.ip, channel.channel)
+                if cursor.pushed_at is not None and (now - cursor.pushed_at).total_seconds() < ALARM_EVENT_DEBOUNCE:
+                    continue
+                cursor.pushed_at = now
+                await store_cursor(client.ip, channel.channel, cursor)
+                logger.info(f"{site.name}: канал {channel.channel} - тревога из потока событий: {event}")
+                task = asyncio.create_task(handle_pushed_alarm(site, channel, bot, now))
+                alarm_tasks.add(task)
+                task.add_done_callback(alarm_tasks.discard)
+        except Exception as e:
+            logger.error(f"Регистратор {site.name}: поток событий оборвался: {e}")
+
+        if events_connected.is_set():
+            logger.warning(f"Регистратор {site.name}: возвращаемся к опросу каналов")
+        events_connected.clear()
+        await asyncio.sleep(5)
+
+
+async def check_alarm_cycle(site: AlarmSite, bot):
+    """Опросчик одного регистратора: своё HTTP-соединение, курсоры и подписка на события."""
+    client = RecorderClient(site.ip, site.username, site.password, max_concurrency=RECORDER_CONCURRENCY)
+    # Сильные ссылки на задачи обработки тревог из потока событий: иначе сборщик мусора может удалить их посреди рендера
+    alarm_tasks: set[asyncio.Task] = set()
+    try:
+        await load_alarm_cursors(client.ip)
+        events_connected = asyncio.Event()
+        tasks = [poll_channel(client, site, channel, bot, events_connected) for channel in site.channels]
+        if ALARM_EVENT_STREAM:
+            tasks.append(listen_alarm_events(client, site, bot, events_connected, alarm_tasks))
+        await asyncio.gather(*tasks)
+    finally:
+        # Опросчик останавливают (регистратор изменён или удалён) - тревоги этого регистратора тоже отменяются
+        for task in alarm_tasks:
+            task.cancel()
+        await asyncio.gather(*alarm_tasks, return_exceptions=True)
+        await client.close()
+
+
+async def load_alarm_sites() -> dict[int, AlarmSite]:
+    async with AsyncSessionLocal() as session:
+        recorders = await get_active_recorders(session)
+        if not recorders and recorder_ip:
+            # Первый запуск после перехода на регистраторы из БД: переносим настройки из переменных окружения
+            logger.warning(f"Регистраторов в БД нет, добавляем {recorder_ip} из переменных окружения")
+            # Канал N пишется в камеру с id N, если такая камера есть; иначе канал только уведомляет о тревогах
+            camera_ids = {camera.id for camera in await get_all(session, 'cameras')}
+            channels = {}
+            for channel in range(1, RECORDER_CHANNELS + 1):
+                channels[channel] = channel if channel in camera_ids else None
+                if channel not in camera_ids:
+                    logger.warning(f"Канал {channel} регистратора {recorder_ip}: камеры с id {channel} нет, "
+                                   f"клипы по тревогам канала сохраняться не будут")
+            await seed_recorder(
+                session, recorder_ip, recorder_ip, recorder_username, recorder_password,
+                channels=channels,
+                notify_chats=ALARM_NOTIFY_CHATS, video_chats=SEND_CHANNELS
+            )
+            recorders = await get_active_recorders(session)
+        return {recorder.id: AlarmSite.from_row(recorder) for recorder in recorders}
+
+
+async def alarm_supervisor(bot):
+    """
+    Держит по одному опросчику на каждый активный регистратор из БД. Раз в ALARM_RELOAD_INTERVAL секунд
+    перечитывает таблицы: новые регистраторы запускаются, удалённые и выключенные останавливаются,
+    изменённые перезапускаются, упавшие опросчики поднимаются заново.
+    """
+    running: dict[int, tuple[AlarmSite, asyncio.Task]] = {}
+    while True:
+        try:
+            sites = await load_alarm_sites()
+        except Exception as e:
+            logger.error(f"Не удалось загрузить регистраторы из БД: {e}", exc_info=True)
+            sites = {recorder_id: site for recorder_id, (site, _) in running.items()}
+
+        for recorder_id, (site, task) in list(running.items()):
+            if sites.get(recorder_id) != site or task.done():
+                if task.done() and not task.cancelled() and task.exception() is not None:
+                    logger.error(f"Регистратор {site.name}: опросчик упал: {task.exception()}")
+                task.cancel()
+                del running[recorder_id]
+
+        for recorder_id, site in sites.items():
+            if recorder_id not in running:
+                logger.info(f"Регистратор {site.name} ({site.ip}): запуск опроса каналов "
+                            f"{[channel.channel for channel in site.channels]}")
+                running[recorder_id] = (site, asyncio.create_task(check_alarm_cycle(site, bot)))
+
+        await asyncio.sleep(ALARM_RELOAD_INTERVAL)
+
+
+async def save_and_send_video_to_channel(site: AlarmSite, channel: AlarmChannel, bot,
+                                         alarm_start_time: datetime | None = None) -> bool:
+    if channel.camera_id is None:
+        return False
+    camera_id = channel.camera_id
+    offset = (datetime.now() - alarm_start_time).seconds if alarm_start_time is not None else 0
+    clip = await save_video(camera_id, camera_id, None, offset, PRIORITY_ALARM, ALARM_WATERMARK)
+
+    if clip is None:
+        await notify_alarm(site, f"Ошибка при сохранении видео по тревоге. Камера: {camera_id}", bot)
+        return False
+    try:
+        # Файл загружается в Telegram один раз (первой отправкой), остальные каналы получают его file_id
+        results = await asyncio.gather(*(clip.send(bot, chat_id) for chat_id in site.video_chats),
+                                       return_exceptions=True)
+    finally:
+        clip.release()
+
+    for chat_id, result in zip(site.video_chats, results):
+        if isinstance(result, Exception):
+            logger.error(f"Камера {camera_id}: не удалось отправить клип в канал {chat_id}: {result}")
+
+    if clip.file_id is None or channel.court_id is None:
+        return clip.file_id is not None
+
+    async with AsyncSessionLocal() as session:
+        await create_item(
+            session, 'videos',
+            video_id=clip.file_id,
+            description=f"Тревога, {site.name}, канал {channel.channel}",
+            timestamp=alarm_start_time or datetime.now(),
+            court_id=channel.court_id
+        )
+
+    return True
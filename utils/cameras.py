@@ -1,21 +1,25 @@
-import re
 import json
 import logging
-from datetime import timedelta
+import math
+import shutil
+import time
+import uuid
 import asyncio
 
-import aiohttp
-import pandas as pd
-import requests
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import FSInputFile, Message
 from config.config import *
 from utils import setup_logger
+from utils.encoder import encode_queue, EncodeJob, EncodeQueueFull, PRIORITY_USER
+from utils.sender import sender
+from utils.segments import Segment, parse_segment_list_entry, register_segment, reset_segments, select_segments, \
+    get_segments, discard_segment, StreamInfo, stream_infos, parse_stream_info, set_live_segment, \
+    get_buffer_end, capture_gops
+from utils.texts import queue_position_text, queue_full_text, error_text
 
 logger = logging.getLogger(__name__)
 logger_ffmpeg = setup_logger("ffmpeg")
 
-alarm_start_time: datetime | None = None
-
 
 async def check_rtsp_connection(camera, timeout: int = 5) -> bool:
     rtsp_url = (
@@ -52,25 +56,71 @@ async def start_buffer(camera):
             line = await stream.readline()
             if not line:
                 break
-            log_func(f"[{camera_name}] {line.decode(errors='ignore').strip()}")
+            text = line.decode(errors='ignore').strip()
+            log_func(f"[{camera_name}] {text}")
+            # Первое описание видеопотока в логе ffmpeg - параметры входа камеры
+            if camera.id not in stream_infos:
+                info = parse_stream_info(text)
+                if info is not None:
+                    stream_infos[camera.id] = info
+                    logger.info(f"Камера {camera_name}: {info}")
+
+    async def read_segment_list(stream, camera_id, prerender_queue):
+        # ffmpeg дописывает строку в csv-список в момент закрытия сегмента
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            segment = parse_segment_list_entry(line.decode(errors='ignore'), time.time())
+            if segment is not None:
+                register_segment(camera_id, segment)
+                set_live_segment(camera_id, segment)
+                if prerender_queue is not None:
+                    prerender_queue.put_nowait(segment)
 
     rtsp_url = (
         f"rtsp://{camera.login}:{camera.password}@{camera.ip}:{camera.port}"
         "/cam/realmonitor?channel=1&subtype=0"
     )
 
-    cmd = [
-        "ffmpeg", "-rtsp_transport", "tcp", "-i", rtsp_url,
-        "-c", "copy", "-f", "segment",
-        "-aspect", "16:9",
-        "-segment_time", str(SEGMENT_TIME),
-        "-segment_wrap", str(SEGMENT_WRAP),
-        "-reset_timestamps", "1",
-        "-loglevel", "info",
-        str(SEGMENT_DIR / f"buffer_{camera.id}_%03d.mp4")
-    ]
-
     while True:
+        # Новый процесс начинает нумерацию сегментов заново, старый индекс недействителен
+        reset_segments(camera.id)
+        stream_infos.pop(camera.id, None)
+        prerender_queue, prerender_task = None, None
+        if PRERENDER:
+            reset_segments(camera.id, prerendered_buffers)
+            prerender_queue = asyncio.Queue()
+            prerender_task = asyncio.create_task(prerender_segments(camera, prerender_queue))
+
+        # При копировании потока сегмент режется только по ключевому кадру,
+        # поэтому длительность сегмента подбираем кратной GOP камеры
+        gop = await probe_gop(rtsp_url) if GOP_PROBE_SECONDS > 0 else None
+        if gop:
+            capture_gops[camera.id] = gop
+            segment_time = gop * max(math.ceil(SEGMENT_TIME / gop - 0.01), 1)
+            logger.info(f"Камера {camera.name}: GOP {gop:.3f} сек., длительность сегмента {segment_time:.3f} сек.")
+        else:
+            capture_gops.pop(camera.id, None)
+            segment_time = SEGMENT_TIME
+
+        cmd = [
+            "ffmpeg", "-rtsp_transport", "tcp", "-i", rtsp_url,
+            "-c", "copy", "-f", "segment",
+            "-aspect", "16:9",
+            "-segment_time", f"{segment_time:.3f}",
+            # Ключевой кадр, пришедший чуть раньше границы из-за джиттера меток времени, тоже считаем границей
+            "-segment_time_delta", f"{(gop or 0) / 2:.3f}",
+            "-segment_wrap", str(SEGMENT_WRAP),
+            "-reset_timestamps", "1",
+            "-segment_list", "pipe:1",
+            "-segment_list_type", "csv",
+            # Фрагментированный mp4: открытый сегмент читается до последнего завершённого GOP
+            "-segment_format_options", "movflags=frag_keyframe+empty_moov+default_base_moof",
+            "-loglevel", "info",
+            str(SEGMENT_DIR / f"buffer_{camera.id}_%03d.mp4")
+        ]
+
         process = await asyncio.create_subprocess_exec(
             *cmd,
             stdout=asyncio.subprocess.PIPE,
@@ -84,19 +134,113 @@ async def start_buffer(camera):
 
         await asyncio.gather(
             log_stream(process.stderr, logger_ffmpeg.warning, camera.name),
+            read_segment_list(process.stdout, camera.id, prerender_queue),
             process.wait()
         )
+        if prerender_task is not None:
+            prerender_task.cancel()
 
         logger.warning(f"FFmpeg завершил работу для камеры {camera.name}. Перезапуск через 5 секунд.")
         await asyncio.sleep(5)
 
 
-async def get_video_resolution(video_path):
+async def probe_gop(rtsp_url: str) -> float | None:
+    """
+    Определяет длительность GOP потока: читает GOP_PROBE_SECONDS секунд пакетов и берёт медиану
+    интервалов между ключевыми кадрами. Возвращает None, если определить не удалось.
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-rtsp_transport", "tcp",
+        "-select_streams", "v:0",
+        "-read_intervals", f"%+{GOP_PROBE_SECONDS}",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        rtsp_url
+    ]
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        out, _ = await asyncio.wait_for(proc.communicate(), timeout=GOP_PROBE_SECONDS + 10)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        logger.error("Не удалось определить GOP потока: таймаут ffprobe")
+        return None
+
+    keyframes = []
+    for line in out.decode(errors='ignore').splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                keyframes.append(float(pts_time))
+            except ValueError:
+                continue
+
+    intervals = sorted(b - a for a, b in zip(keyframes, keyframes[1:]) if b > a)
+    if not intervals:
+        return None
+    return intervals[len(intervals) // 2]
+
+
+async def prerender_segments(camera, prerender_queue: asyncio.Queue):
+    """
+    Фоновый рендер: накладывает водяной знак на каждый закрытый сегмент и кладёт результат
+    в параллельное кольцо prerendered_buffers. Сохранение из такого кольца - склейка без перекодирования.
+    """
+    while True:
+        segment = await prerender_queue.get()
+        # Если рендер отстал и исходный файл уже перезаписан, сегмент пропускаем
+        if segment not in get_segments(camera.id):
+            logger.warning(f"Камера {camera.name}: пропущен предрендер {segment.path.name}, сегмент устарел")
+            continue
+
+        try:
+            watermark_file = (await get_stream_info(camera.id, segment.path)).watermark_file
+        except Exception as e:
+            logger.error(f"Камера {camera.name}: не удалось получить разрешение видео: {str(e)}")
+            continue
+
+        output_path = SEGMENT_DIR / f"prerendered_{segment.path.name}"
+        discard_segment(camera.id, output_path, prerendered_buffers)
+
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", str(segment.path),
+            "-i", watermark_file,
+            "-filter_complex", "[0:v][1:v]overlay=0:0,setsar=1,setdar=16/9",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+            "-threads", str(ENCODE_THREADS),
+            # Ключевой кадр каждую секунду - чтобы склейку без перекодирования можно было резать с точностью до секунды
+            "-force_key_frames", "expr:gte(t,n_forced*1)",
+            "-an",
+            str(output_path)
+        ]
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, err = await proc.communicate()
+        if proc.returncode != 0:
+            logger.error(f"Камера {camera.name}: не удалось отрендерить {segment.path.name}:\n"
+                         f"{err.decode(errors='ignore')}")
+            continue
+
+        register_segment(camera.id, Segment(output_path, segment.start_pts, segment.duration, segment.wall_end),
+                         prerendered_buffers)
+
+
+async def probe_stream_info(video_path) -> StreamInfo:
     cmd = [
         "ffprobe",
         "-v", "error",
         "-select_streams", "v:0",
-        "-show_entries", "stream=width,height",
+        "-show_entries", "stream=codec_name,width,height,avg_frame_rate",
         "-of", "json",
         str(video_path)
     ]
@@ -108,266 +252,394 @@ async def get_video_resolution(video_path):
     )
     out, _ = await proc.communicate()
 
-    info = json.loads(out)
-    width = info['streams'][0]['width']
-    height = info['streams'][0]['height']
-    return width, height
+    stream = json.loads(out)['streams'][0]
+    num, _, den = stream.get('avg_frame_rate', '0/0').partition('/')
+    fps = int(num) / int(den) if den and int(den) else None
+    return StreamInfo(stream['codec_name'], stream['width'], stream['height'], fps)
+
+
+async def get_stream_info(camera_id: int, video_path) -> StreamInfo:
+    """
+    Параметры потока камеры из кэша. Обычно кэш заполняется из лога ffmpeg в start_buffer,
+    если этого не произошло - один раз пробуем закрытый сегмент.
+    """
+    info = stream_infos.get(camera_id)
+    if info is None:
+        info = await probe_stream_info(video_path)
+        stream_infos[camera_id] = info
+    return info
+
+
+class SaveVideoError(Exception):
+    """Ошибка сохранения клипа. Текст исключения показывается пользователю."""
+
+
+class Clip:
+    """
+    Рендер клипа, к которому могут присоединиться несколько запросов с одной камеры.
+    Первая отправка загружает файл в Telegram, остальные переиспользуют его file_id.
+    """
+
+    def __init__(self, camera_id: int, end: float, path: Path, priority: int, watermark: bool = True):
+        self.camera_id = camera_id
+        self.requested_end = end
+        self.end = end
+        self.path = path
+        self.priority = priority
+        self.watermark = watermark
+        self.job: EncodeJob | None = None
+        self.file_id: str | None = None
+        self.users = 0
+        self._send_lock = asyncio.Lock()
+
+    def accepts(self, end: float) -> bool:
+        if self.job is None or (self.job.future.done() and self.job.future.exception() is not None):
+            return False
+        return abs(end - self.requested_end) <= COALESCE_WINDOW
+
+    def join(self, end: float) -> None:
+        # Пока рендер не начался, конец клипа можно сдвинуть к самому свежему запросу
+        if encode_queue.position(self.job) > 0:
+            self.end = max(self.end, end)
+        self.users += 1
+
+    async def render(self) -> Path:
+        return await render_window(self.camera_id, self.end, self.path, self.watermark)
+
+    async def send(self, bot, chat_id: int, **kwargs) -> Message:
+        """Первая отправка загружает файл, остальные (в т.ч. параллельные) переиспользуют его file_id."""
+        if self.file_id is None:
+            async with self._send_lock:
+                if self.file_id is None:
+                    sent_message = await self._upload(bot, chat_id, **kwargs)
+                    if sent_message.video is not None:
+                        self.file_id = sent_message.video.file_id
+                    return sent_message
+        return await sender.send(chat_id, bot.send_video, video=self.file_id, **kwargs)
+
+    async def _upload(self, bot, chat_id: int, **kwargs) -> Message:
+        if TELEGRAM_API_URL and TELEGRAM_API_LOCAL:
+            # Локальный сервер Bot API читает файл с диска сам
+            local_uri = (TELEGRAM_API_LOCAL_DIR / self.path.relative_to(SEGMENT_DIR)).as_uri()
+            try:
+                return await sender.send(chat_id, bot.send_video, video=local_uri, **kwargs)
+            except TelegramBadRequest as e:
+                logger.warning(f"Сервер Bot API не принял {local_uri}: {e}. Загружаем файл по HTTP")
+        return await sender.send(chat_id, bot.send_video, video=FSInputFile(str(self.path)), **kwargs)
+
+    def release(self) -> None:
+        """Освобождает клип. Файл удаляется, когда его отпустил последний получатель."""
+        self.users -= 1
+        if self.users > 0:
+            return
+        if _clips.get((self.camera_id, self.priority, self.watermark)) is self:
+            del _clips[(self.camera_id, self.priority, self.watermark)]
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Ошибка при удалении файла: {e}")
+
+
+# Рендеры в работе по (камера, приоритет, водяной знак)
+_clips: dict[tuple[int, int, bool], Clip] = {}
 
 
-async def save_video(user_id: int, camera_id: int, message: Message | None, offset: int = 0):
-    # Определяем количество сегментов, которое нужно собрать
-    count = (CUT_DURATION + SEGMENT_TIME - 1) // SEGMENT_TIME + 1
+async def save_video(user_id: int, camera_id: int, message: Message | None, offset: int = 0,
+                     priority: int = PRIORITY_USER, watermark: bool = True) -> Clip | None:
+    """
+    Сохраняет клип с камеры. Возвращённый клип нужно отправить через Clip.send и затем вызвать Clip.release.
+    None - клип не сохранён; причину save_video сам отвечает на message, повторно сообщать не нужно.
+    Клип без водяного знака (watermark=False) может собираться умной нарезкой (CAMERA_RENDER_MODE=smart).
+    """
     if offset + CUT_DURATION > BUFFER_DURATION:
         logger.error(f"Слишком большой офсет! ({offset} + {CUT_DURATION} > {BUFFER_DURATION})")
         offset = 0
 
-    # Выбираем сегменты для конкретной камеры
-    seg_pattern = f"buffer_{camera_id}_*.mp4"
-    # Собираем все сегменты и сортируем их по времени модификации (хронологически)
-    segs = list(SEGMENT_DIR.glob(seg_pattern))
-    segs.sort(key=lambda p: p.stat().st_mtime)
+    # Берём сегменты из индекса камеры, который наполняет start_buffer
+    buffer_end = get_buffer_end(camera_id)
+    if buffer_end is None:
+        if message is not None:
+            await message.answer("Буфер пуст. Нечего сохранять.")
+        return
+
+    # Клип заканчивается «сейчас» (с учётом офсета), включая открытый сегмент.
+    # Границы фиксируются в момент запроса, сегменты выбираются уже при старте кодирования.
+    end = min(time.time() - offset, buffer_end)
+
+    clip = _clips.get((camera_id, priority, watermark))
+    if clip is not None and clip.accepts(end):
+        clip.join(end)
+        logger.info(f"Камера {camera_id}: сохранение для {user_id} присоединено к {clip.path.name}")
+    else:
+        # Итоговый путь для сохранения видео (уникальный для каждого рендера)
+        job_id = uuid.uuid4().hex[:8]
+        output_path = SEGMENT_DIR / f"video_camera_{camera_id}_user_{user_id}_{job_id}.mp4"
+        clip = Clip(camera_id, end, output_path, priority, watermark)
+
+        # Пользовательские сохранения при переполненной очереди отклоняются, тревожные - откладываются
+        try:
+            clip.job = await encode_queue.submit(clip.render, priority=priority, wait=priority != PRIORITY_USER)
+        except EncodeQueueFull as e:
+            logger.warning(f"Камера {camera_id}: сохранение для {user_id} отклонено - {e}")
+            if message is not None:
+                await message.answer(queue_full_text)
+            return
+        clip.users += 1
+        _clips[(camera_id, priority, watermark)] = clip
+
+    position = encode_queue.position(clip.job)
+    if position and message is not None:
+        await message.answer(queue_position_text.format(position))
 
-    if not segs and message is not None:
-        await message.answer("Буфер пуст. Нечего сохранять.")
+    try:
+        await clip.job.future
+    except SaveVideoError as e:
+        clip.release()
+        if message is not None:
+            await message.answer(str(e))
+        return
+    except Exception:
+        # Сбой рендера (нет ffmpeg, ошибка склейки): клип убирается из рендеров в работе, файл удаляется
+        clip.release()
+        logger.exception(f"Камера {camera_id}: ошибка рендера {clip.path.name} для {user_id}")
+        if message is not None:
+            await message.answer(error_text)
         return
 
-    # Берём последние count сегментов в хронологическом порядке
-    offset_files = offset // SEGMENT_TIME
-    last_segs = segs[-count-offset_files:len(segs)-offset_files]
+    return clip
+
 
-    # Получаем разрешение первого сегмента
+async def render_window(camera_id: int, end: float, output_path: Path, watermark: bool = True) -> Path:
+    """
+    Собирает клип длиной CUT_DURATION, заканчивающийся в момент end, из буфера камеры.
+    Клип с водяным знаком - склейка предрендера или полное перекодирование, без знака - умная нарезка
+    (если она включена и возможна) или полное перекодирование без наложения.
+    """
+    last_segs, head = select_segments(camera_id, end, CUT_DURATION, live=True)
+    if not last_segs:
+        logger.error(f"Камера {camera_id}: в буфере нет сегментов до {datetime.fromtimestamp(end)}")
+        raise SaveVideoError("Буфер пуст. Нечего сохранять.")
+    tail = max(last_segs[-1].wall_end - end, 0.0)
+    duration = sum(seg.duration for seg in last_segs) - head - tail
+
+    # Если все нужные сегменты уже отрендерены в фоне (с водяным знаком), достаточно склейки без перекодирования.
+    # Открытого сегмента в предрендере нет, поэтому такой клип заканчивается на последнем закрытом сегменте.
+    if PRERENDER and watermark:
+        closed = get_segments(camera_id)
+        closed_end = min(end, closed[-1].wall_end) if closed else end
+        pre_segs, pre_head = select_segments(camera_id, closed_end, CUT_DURATION, prerendered_buffers)
+        src_segs, _ = select_segments(camera_id, closed_end, CUT_DURATION)
+        if pre_segs and [seg.wall_end for seg in pre_segs] == [seg.wall_end for seg in src_segs]:
+            pre_duration = sum(seg.duration for seg in pre_segs) - pre_head - (pre_segs[-1].wall_end - closed_end)
+            returncode, err = await concat_clip(pre_segs, pre_head, pre_duration, output_path)
+            if returncode == 0:
+                return output_path
+            logger.error(f"Не удалось склеить предрендер, рендерим заново:\n{err}")
+
+    # Водяной знак выбираем по разрешению потока камеры
     try:
-        width, height = await get_video_resolution(last_segs[0])
+        stream_info = await get_stream_info(camera_id, last_segs[0].path)
     except Exception as e:
         logger.error(f"Не удалось получить разрешение видео: {str(e)}", exc_info=True)
-        if message is not None:
-            await message.answer("Не получилось сохранить видео.")
-        return
-    watermark_file = "media/" + ("watermark_1080.png" if height >= 1080 else "watermark_720.png")
+        raise SaveVideoError("Не получилось сохранить видео.")
 
-    # Готовим файл inputs.txt с абсолютными путями
-    inputs_txt = Path("inputs.txt")
-    with inputs_txt.open("w", encoding="utf-8") as f:
-        for seg in last_segs:
-            abs_path = seg.resolve().as_posix()
-            f.write(f"file '{abs_path}'\n")
+    # Умная нарезка не накладывает водяной знак, поэтому только для клипов без него.
+    # Нужны известный GOP и кодировщик для кодека камеры.
+    gop = capture_gops.get(camera_id)
+    if not watermark and RENDER_MODE == "smart" and gop and stream_info.codec in SMART_RENDER_ENCODERS:
+        returncode, err = await smart_render_clip(last_segs, head, duration, gop, stream_info.codec, output_path)
+        if returncode == 0:
+            return output_path
+        logger.error(f"Не удалось собрать видео умной нарезкой, рендерим полностью:\n{err}")
+    watermark_file = stream_info.watermark_file if watermark else None
+
+    returncode, err = await render_clip(last_segs, head, duration, watermark_file, output_path)
+    if returncode != 0:
+        logger.error(f"Не удалось собрать видео:\n{err}")
+        raise SaveVideoError("Не удалось собрать видео.")
+
+    return output_path
 
-    # Итоговый путь для сохранения видео
-    output_concat_path = SEGMENT_DIR / f"video_camera_{camera_id}_user_{user_id}_concat.mp4"
-    output_watermark_path = SEGMENT_DIR / f"video_camera_{camera_id}_user_{user_id}.mp4"
 
-    # Шаг 1: Склейка сегментов
+async def render_clip(segments: list[Segment], head: float, duration: float, watermark_file: str | None,
+                      output_path: Path) -> tuple[int, str]:
+    """
+    Склеивает сегменты и накладывает водяной знак (если watermark_file задан) за один проход ffmpeg.
+    Список сегментов для concat-демуксера у каждого сохранения свой, промежуточных файлов нет.
+    """
+    inputs_txt = write_concat_list(segments, output_path.with_suffix(".txt"))
+
     cmd = [
         "ffmpeg", "-y",
         "-f", "concat", "-safe", "0",
         "-i", str(inputs_txt),
-        "-c", "copy",
-        "-movflags", "+faststart",
-        str(output_concat_path)
     ]
-
-    proc = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    _, err = await proc.communicate()
-
-    if proc.returncode != 0:
-        logger.error(f"Не удалось собрать видео:\n{err.decode(errors='ignore')}")
-        if message is not None:
-            await message.answer("Не удалось собрать видео.")
-        return
-
-    # Шаг 2: Наложение водяного знака
-    cmd_overlay = [
-        "ffmpeg", "-y",
-        "-i", str(output_concat_path),
-        "-i", watermark_file,
-        "-filter_complex", "[0:v][1:v]overlay=0:0,setsar=1,setdar=16/9",
+    if watermark_file is not None:
+        cmd += ["-i", watermark_file, "-filter_complex", "[0:v][1:v]overlay=0:0,setsar=1,setdar=16/9"]
+    else:
+        cmd += ["-vf", "setsar=1,setdar=16/9"]
+    cmd += [
+        # Точная обрезка по кадрам после декодирования
+        "-ss", f"{head:.3f}", "-t", f"{duration:.3f}",
         "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+        "-threads", str(ENCODE_THREADS),
         "-an",
         "-movflags", "+faststart",
-        str(output_watermark_path)
+        str(output_path)
     ]
 
-    proc = await asyncio.create_subprocess_exec(
-        *cmd_overlay,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    _, err = await proc.communicate()
-
-    if proc.returncode != 0:
-        logger.error(f"Не удалось наложить водяной знак:\n{err.decode(errors='ignore')}")
-        if message is not None:
-            await message.answer("Не удалось наложить водяной знак.")
-        return
-
-    return FSInputFile(str(output_watermark_path))
-
-
-async def async_get(url, auth):
-    def sync_request():
-        try:
-            response = requests.get(url, auth=auth, timeout=10)
-            logger.info(f"GET-запрос: {url} - {response.status_code}")
-            return response.status_code, response.text.strip()
-        except Exception as e:
-            logger.error(f"Ошибка при GET-запросе: {url}\n{e}")
-            return None, ""
-
-    return await asyncio.to_thread(sync_request)
-
-
-# --- Получение следующей порции видео ---
-async def get_next_videos(session, ip, auth, object_id):
-    url = f"http://{ip}/cgi-bin/mediaFileFind.cgi?action=findNextFile&object={object_id}&count=100"
-    status, response_text = await async_get(url, auth)
-
-    if status != 200:
-        logger.error(f"Ошибка при findNextFile: {response_text}")
-        return pd.DataFrame()
-
-    lines = [line.strip() for line in response_text.splitlines() if line.startswith('items')]
-    data = {}
-
-    for line in lines:
-        match = re.match(r'items\[(\d+)\]\.([^\=]+)=(.+)', line)
-        if match:
-            index, key, value = match.groups()
-            index = int(index)
-            if index not in data:
-                data[index] = {}
-            data[index][key] = value
-
-    return pd.DataFrame.from_dict(data, orient='index')
-
-
-async def destroy_find_object(ip, auth, object_id):
-    url = f"http://{ip}/cgi-bin/mediaFileFind.cgi?action=factory.destroy&object={object_id}"
-    requests.get(url, auth=auth)
-
-
-# --- Получение последнего события AlarmLocal ---
-async def get_latest_alarm_local_video(ip, auth, channel):
-    global alarm_start_time
-    end_time = datetime.now() + timedelta(minutes=5)
-    start_time = end_time - timedelta(minutes=15)
-    start_time_str = start_time.strftime("%Y-%m-%d %H:%M:%S")
-    end_time_str = end_time.strftime("%Y-%m-%d %H:%M:%S")
-    storage_path = "/dev/sda"
-
-    async with aiohttp.ClientSession() as session:
-        # 1. Создание объекта поиска
-        create_url = f"http://{ip}/cgi-bin/mediaFileFind.cgi?action=factory.create"
-        status, text = await async_get(create_url, auth)
-        if status != 200:
-            logger.error("Ошибка создания объекта поиска: %s", text)
-            return None
-
-        object_id = text.split("=")[-1].strip()
-        logger.info(f"Channel: {channel}, Object ID: {object_id}")
-
-        # 2. Инициация поиска
-        start_find_url = (
-            f"http://{ip}/cgi-bin/mediaFileFind.cgi?action=findFile"
-            f"&object={object_id}"
-            f"&condition.Channel={channel}"
-            f"&condition.StartTime={start_time_str}"
-            f"&condition.EndTime={end_time_str}"
-            f"&condition.Dirs=n&condition.Dirs[0]={storage_path}"
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
         )
+        _, err = await proc.communicate()
+    finally:
+        inputs_txt.unlink(missing_ok=True)
 
-        status, text = await async_get(start_find_url, auth)
-        if status != 200 or "false" in text:
-            logger.error("Ошибка начала поиска: %s", text)
-            return None
+    return proc.returncode, err.decode(errors='ignore')
 
-        # 3. Получение видео с событиями
-        cluster = None
-        alarm_start_time = None
-        while True:
-            df = await get_next_videos(session, ip, auth, object_id)
-            if df.empty:
-                break
 
-            df['is_alarm'] = df.filter(like='Events').apply(
-                lambda row: 'AlarmLocal' in row.values.astype(str),
-                axis=1
-            )
-            alarm_df = df[df['is_alarm']]
-
-            if alarm_df.empty:
-                continue
-
-            latest_row = alarm_df.sort_values(by='Cluster', ascending=False).iloc[0]
-            cluster = latest_row.get('Cluster', None)
-            alarm_start_time_str = latest_row.get('StartTime', None)
-            if alarm_start_time_str is not None:
-                alarm_start_time = datetime.strptime(alarm_start_time_str, "%Y-%m-%d %H:%M:%S")
-            if cluster is not None:
-                logger.info(latest_row)
-                break
-
-        await destroy_find_object(ip, auth, object_id)
-        return cluster
+async def concat_clip(segments: list[Segment], head: float, duration: float, output_path: Path) -> tuple[int, str]:
+    """Склеивает уже отрендеренные сегменты без перекодирования."""
+    inputs_txt = write_concat_list(segments, output_path.with_suffix(".txt"))
 
+    cmd = [
+        "ffmpeg", "-y",
+        # -ss перед входом: при копировании потока начало клипа выравнивается по ближайшему ключевому кадру
+        "-ss", f"{head:.3f}",
+        "-f", "concat", "-safe", "0",
+        "-i", str(inputs_txt),
+        "-t", f"{duration:.3f}",
+        "-c", "copy",
+        "-movflags", "+faststart",
+        str(output_path)
+    ]
 
-# --- Цикл проверки тревог ---
-async def check_alarm(ip, auth, channel, bot):
-    logger.info(f" Проверка канала {channel} ".center(80, '='))
-    last_cluster = last_clusters.get(channel, None)
-    cluster = await get_latest_alarm_local_video(ip, auth, channel)
     try:
-        cluster = int(cluster) if cluster is not None else None
-    except (ValueError, TypeError):
-        logger.error(f"Канал {channel} - Ошибка парсинга кластера: {cluster}")
-        cluster = None
-
-    if cluster is not None and (last_cluster is None or cluster > last_cluster):
-        last_cluster = cluster
-        await bot.send_message(chat_id=289208255, text=f"Обнаружено событие в камере: {cluster} (канал {channel})")
-        await bot.send_message(chat_id=460205942, text=f"Обнаружено событие в камере: {cluster} (канал {channel})")
-        await save_and_send_video_to_channel(channel, bot)
-
-    last_clusters[channel] = last_cluster
-    logger.info(f" Канал {channel} - Последний кластер: {last_cluster} ".center(80, '='))
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, err = await proc.communicate()
+    finally:
+        inputs_txt.unlink(missing_ok=True)
 
+    return proc.returncode, err.decode(errors='ignore')
 
-async def check_alarm_cycle(ip, auth, bot, channel_end):
-    while True:
-        for i in range(1, channel_end + 1):
-            await check_alarm(ip, auth, i, bot)
-        await asyncio.sleep(10)
 
+# Кодировщики для перекодирования граничных GOP при умной нарезке
+SMART_RENDER_ENCODERS = {"h264": "libx264", "hevc": "libx265"}
 
-async def save_and_send_video_to_channel(camera_id, bot) -> bool:
-    global alarm_start_time
-    offset = (datetime.now() - alarm_start_time).seconds if alarm_start_time is not None else 0
-    video_file = await save_video(camera_id, camera_id, None, offset)
 
-    if video_file is None:
-        bot.send_message(chat_id=289208255, text=f"Ошибка при сохранении видео по кнопке. Камера: {camera_id}")
-        return False
-    for chan in SEND_CHANNELS:
-        sent_message = await bot.send_video(chat_id=chan, video=video_file)
-
-    # TODO: Добавить сохранение в БД
-    # async with AsyncSessionLocal() as session:
-    #     await create_item(
-    #         session, 'videos',
-    #         video_id=sent_message.video.file_id,
-    #         timestamp=datetime.now(),
-    #         user_id=message.from_user.id,
-    #         court_id=user.selected_court_id
-    #     )
-    #     await session.commit()
+async def smart_render_clip(segments: list[Segment], head: float, duration: float, gop: float, codec: str,
+                            output_path: Path) -> tuple[int, str]:
+    """
+    Умная нарезка без водяного знака: целые GOP внутри клипа копируются как есть,
+    перекодируются только неполные GOP на границах. Сегменты начинаются с ключевого кадра,
+    поэтому ключевые кадры внутри сегмента ожидаются через каждые gop секунд от его начала.
+    """
+    encoder = SMART_RENDER_ENCODERS[codec]
+    first, last = segments[0], segments[-1]
+    end_in_last = head + duration - sum(seg.duration for seg in segments[:-1])
+
+    # Первый ключевой кадр не раньше начала клипа и последний не позже его конца
+    head_kf = min(math.ceil(head / gop - 0.001) * gop, first.duration)
+    tail_kf = math.floor(end_in_last / gop + 0.001) * gop
+    if len(segments) == 1 and head_kf >= tail_kf:
+        # Клип короче одного GOP - копировать нечего
+        tail_kf = head_kf = end_in_last
+
+    parts_dir = output_path.with_suffix("")
+    parts_dir.mkdir(parents=True, exist_ok=True)
+
+    async def run(cmd) -> tuple[int, str]:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, err = await proc.communicate()
+        return proc.returncode, err.decode(errors='ignore')
+
+    def encode_cmd(source: Path, start: float, length: float, part: Path) -> list[str]:
+        return [
+            "ffmpeg", "-y",
+            "-ss", f"{start:.3f}", "-i", str(source),
+            "-t", f"{length:.3f}",
+            "-c:v", encoder, "-preset", "veryfast", "-crf", "23",
+            "-threads", str(ENCODE_THREADS),
+            "-an",
+            "-f", "mpegts", str(part)
+        ]
+
+    # Части клипа пишутся в MPEG-TS: параметры кодека передаются в потоке, и куски
+    # от камеры и от кодировщика можно склеить копированием
+    tasks, parts = [], []
+    if head_kf > head:
+        parts.append(parts_dir / "head.ts")
+        tasks.append(run(encode_cmd(first.path, head, head_kf - head, parts[-1])))
+
+    copy_segments = []
+    for i, seg in enumerate(segments):
+        inpoint = head_kf if i == 0 else 0.0
+        outpoint = tail_kf if i == len(segments) - 1 else seg.duration
+        if outpoint > inpoint:
+            copy_segments.append((seg, inpoint, outpoint))
+    if copy_segments:
+        copy_txt = parts_dir / "copy.txt"
+        with copy_txt.open("w", encoding="utf-8") as f:
+            for seg, inpoint, outpoint in copy_segments:
+                f.write(f"file '{seg.path.resolve().as_posix()}'\n")
+                f.write(f"inpoint {inpoint:.3f}\n")
+                f.write(f"outpoint {outpoint:.3f}\n")
+        parts.append(parts_dir / "copy.ts")
+        tasks.append(run([
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0",
+            "-i", str(copy_txt),
+            "-c", "copy", "-an",
+            "-f", "mpegts", str(parts[-1])
+        ]))
+
+    if end_in_last > tail_kf:
+        parts.append(parts_dir / "tail.ts")
+        tasks.append(run(encode_cmd(last.path, tail_kf, end_in_last - tail_kf, parts[-1])))
 
     try:
-        os.remove(video_file.path)
-        os.remove(video_file.path.replace('.mp4', '_concat.mp4'))
-    except Exception as e:
-        logging.error(f"Ошибка при удалении файла: {e}")
-
-    return True
+        for returncode, err in await asyncio.gather(*tasks):
+            if returncode != 0:
+                return returncode, err
+
+        parts_txt = parts_dir / "parts.txt"
+        with parts_txt.open("w", encoding="utf-8") as f:
+            for part in parts:
+                f.write(f"file '{part.resolve().as_posix()}'\n")
+        return await run([
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0",
+            "-i", str(parts_txt),
+            "-c", "copy",
+            "-aspect", "16:9",
+            "-movflags", "+faststart",
+            str(output_path)
+        ])
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+def write_concat_list(segments: list[Segment], inputs_txt: Path) -> Path:
+    """
+    Пишет список файлов для concat-демуксера ffmpeg. Длительности берутся из индекса:
+    в заголовке фрагментированного mp4 их нет. Последний сегмент может быть открытым, его читаем до конца.
+    """
+    with inputs_txt.open("w", encoding="utf-8") as f:
+        for i, seg in enumerate(segments):
+            f.write(f"file '{seg.path.resolve().as_posix()}'\n")
+            if i < len(segments) - 1:
+                f.write(f"duration {seg.duration:.3f}\n")
+    return inputs_txt
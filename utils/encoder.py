@@ -0,0 +1,108 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from config.config import ENCODE_WORKERS, ENCODE_QUEUE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Чем меньше число, тем выше приоритет
+PRIORITY_USER = 0
+PRIORITY_ALARM = 1
+
+
+class EncodeQueueFull(Exception):
+    pass
+
+
+@dataclass(order=True)
+class EncodeJob:
+    priority: int
+    seq: int
+    func: Callable[..., Awaitable[Any]] = field(compare=False)
+    args: tuple = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class EncodeQueue:
+    """
+    Очередь задач кодирования с ограниченным числом воркеров.
+    Задачи с меньшим priority обрабатываются раньше, при равном приоритете - в порядке поступления.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending: list[EncodeJob] = []
+        self._seq = itertools.count()
+        self._cond: asyncio.Condition | None = None
+        self._tasks: list[asyncio.Task] = []
+        self.busy = 0  # Воркеров, которые сейчас кодируют
+
+    def _ensure_started(self) -> None:
+        # Воркеры создаются лениво, когда уже есть запущенный event loop
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def position(self, job: EncodeJob) -> int:
+        """
+        Место задачи в очереди (начиная с 1). 0 - задача уже кодируется, завершена или достанется
+        свободному воркеру: задач впереди неё меньше, чем свободных воркеров.
+        """
+        if job not in self._pending:
+            return 0
+        ahead = sum(1 for other in self._pending if other < job)
+        idle = self.workers - self.busy
+        return ahead - idle + 1 if ahead >= idle else 0
+
+    async def submit(self, func: Callable[..., Awaitable[Any]], *args,
+                     priority: int = PRIORITY_USER, wait: bool = False) -> EncodeJob:
+        """
+        Ставит задачу в очередь. Если очередь переполнена, то при wait=False бросает EncodeQueueFull,
+        а при wait=True ждёт, пока в очереди освободится место.
+        """
+        self._ensure_started()
+        async with self._cond:
+            if len(self._pending) >= self.max_pending:
+                if not wait:
+                    raise EncodeQueueFull(f"В очереди кодирования {len(self._pending)} задач")
+                logger.warning(f"Очередь кодирования переполнена ({len(self._pending)}), задача отложена")
+                await self._cond.wait_for(lambda: len(self._pending) < self.max_pending)
+
+            job = EncodeJob(priority, next(self._seq), func, args, asyncio.get_running_loop().create_future())
+            heapq.heappush(self._pending, job)
+            self._cond.notify_all()
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: bool(self._pending))
+                job = heapq.heappop(self._pending)
+                self._cond.notify_all()
+
+            if job.future.done():
+                continue
+            self.busy += 1
+            try:
+                result = await job.func(*job.args)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.busy -= 1
+
+
+encode_queue = EncodeQueue(ENCODE_WORKERS, ENCODE_QUEUE_LIMIT)
@@ -0,0 +1,22 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+from database import AsyncSessionLocal, get_cached_user
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Одна сессия БД на обновление: фильтры и хэндлеры получают её как session, а отправителя - как user.
+    user - снимок CachedUser: пока он свежий в кэше, обновление обходится без запросов в БД, а сессия
+    не берёт соединение из пула. Сессия закрывается после обработки обновления.
+    """
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: dict[str, Any]) -> Any:
+        async with AsyncSessionLocal() as session:
+            data["session"] = session
+            from_user: User | None = data.get("event_from_user")
+            data["user"] = await get_cached_user(session, from_user.id) if from_user is not None else None
+            return await handler(event, data)
@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from typing import AsyncIterator
+from urllib.parse import quote
+
+import aiohttp
+from yarl import URL
+
+logger = logging.getLogger(__name__)
+
+_CHALLENGE_PARAM_RE = re.compile(r'(\w+)=(?:"([^"]*)"|([^\s,]*))')
+_HASHES = {
+    "MD5": hashlib.md5,
+    "MD5-SESS": hashlib.md5,
+    "SHA-256": hashlib.sha256,
+    "SHA-256-SESS": hashlib.sha256,
+}
+
+
+class RecorderClient:
+    """
+    Долгоживущий HTTP-клиент регистратора: одна keep-alive сессия aiohttp и Digest-аутентификация
+    с кэшированием nonce. После первого запроса заголовок Authorization отправляется сразу,
+    без лишнего круга 401 -> повтор; новый challenge запрашивается только когда регистратор отверг nonce.
+    """
+
+    def __init__(self, ip: str, username: str, password: str, timeout: float = 10, max_concurrency: int = 2):
+        self.ip = ip
+        self.username = username
+        self.password = password
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        # Сколько поисков по каналам регистратор выполняет одновременно
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._session: aiohttp.ClientSession | None = None
+        self._challenge: dict[str, str] | None = None
+        self._nonce_count = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Сессия создаётся лениво, когда уже есть запущенный event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def _send(self, path: str, timeout: aiohttp.ClientTimeout | None = None) -> aiohttp.ClientResponse:
+        """Отправляет GET с Digest-аутентификацией. Ответ нужно освободить (async with response)."""
+        # Кодируем URL сами: uri в Digest-заголовке должен совпадать со строкой запроса байт в байт
+        request_uri = quote(path, safe="/?&=[]:,.")
+        url = URL(f"http://{self.ip}{request_uri}", encoded=True)
+        session = self._get_session()
+
+        for attempt in range(2):
+            headers = {}
+            if self._challenge is not None:
+                headers["Authorization"] = self._authorization("GET", request_uri)
+
+            response = await session.get(url, headers=headers, timeout=timeout or self.timeout)
+            challenge = response.headers.get("WWW-Authenticate", "")
+            if response.status == 401 and attempt == 0 and challenge.lower().startswith("digest"):
+                response.release()
+                self._challenge = self._parse_challenge(challenge)
+                self._nonce_count = 0
+                continue
+            return response
+
+    async def get(self, path: str) -> tuple[int | None, str]:
+        """GET-запрос к регистратору. path - путь с query, например «/cgi-bin/...?action=...»."""
+        try:
+            async with await self._send(path) as response:
+                text = await response.text(errors="ignore")
+                logger.info(f"GET-запрос: {path} - {response.status}")
+                return response.status, text.strip()
+        except Exception as e:
+            logger.error(f"Ошибка при GET-запросе: {path}\n{e}")
+        return None, ""
+
+    async def iter_lines(self, path: str) -> AsyncIterator[str]:
+        """GET-запрос, ответ которого разбирается построчно по мере чтения, без сборки всего тела в строку."""
+        async with await self._send(path) as response:
+            logger.info(f"GET-запрос: {path} - {response.status}")
+            if response.status != 200:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history, status=response.status,
+                    message=(await response.text(errors="ignore")).strip()
+                )
+            async for line in response.content:
+                yield line.decode(errors="ignore").strip()
+
+    async def stream_events(self, codes: list[str], heartbeat: int = 5) -> AsyncIterator[dict[str, str]]:
+        """
+        Подписка на события регистратора (eventManager.cgi?action=attach).
+        Ответ - бесконечный multipart-поток, события разбираются по мере поступления.
+        Если за три heartbeat не пришло ни байта, соединение считается оборванным (aiohttp бросит таймаут).
+        """
+        path = f"/cgi-bin/eventManager.cgi?action=attach&codes=[{','.join(codes)}]&heartbeat={heartbeat}"
+        timeout = aiohttp.ClientTimeout(total=None, connect=self.timeout.total, sock_read=heartbeat * 3)
+
+        async with await self._send(path, timeout) as response:
+            if response.status != 200:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history, status=response.status,
+                    message="Регистратор отклонил подписку на события"
+                )
+            parser = EventStreamParser(response.headers.get("Content-Type", ""))
+            async for chunk in response.content.iter_any():
+                for event in parser.feed(chunk):
+                    yield event
+
+    @staticmethod
+    def _parse_challenge(header: str) -> dict[str, str]:
+        params = {}
+        for key, quoted, plain in _CHALLENGE_PARAM_RE.findall(header[len("Digest"):]):
+            params[key.lower()] = quoted or plain
+        return params
+
+    def _authorization(self, method: str, uri: str) -> str:
+        challenge = self._challenge
+        algorithm = challenge.get("algorithm", "MD5").upper()
+        hash_func = _HASHES.get(algorithm, hashlib.md5)
+
+        def h(value: str) -> str:
+            return hash_func(value.encode()).hexdigest()
+
+        realm, nonce = challenge.get("realm", ""), challenge.get("nonce", "")
+        self._nonce_count += 1
+        nc = f"{self._nonce_count:08x}"
+        cnonce = os.urandom(8).hex()
+
+        ha1 = h(f"{self.username}:{realm}:{self.password}")
+        if algorithm.endswith("-SESS"):
+            ha1 = h(f"{ha1}:{nonce}:{cnonce}")
+        ha2 = h(f"{method}:{uri}")
+
+        qop_options = [qop.strip() for qop in challenge.get("qop", "").split(",") if qop.strip()]
+        if "auth" in qop_options:
+            response = h(f"{ha1}:{nonce}:{nc}:{cnonce}:auth:{ha2}")
+        else:
+            response = h(f"{ha1}:{nonce}:{ha2}")
+
+        parts = [
+            f'username="{self.username}"', f'realm="{realm}"', f'nonce="{nonce}"',
+            f'uri="{uri}"', f'response="{response}"', f'algorithm={challenge.get("algorithm", "MD5")}',
+        ]
+        if "auth" in qop_options:
+            parts += ["qop=auth", f"nc={nc}", f'cnonce="{cnonce}"']
+        if "opaque" in challenge:
+            parts.append(f'opaque="{challenge["opaque"]}"')
+        return "Digest " + ", ".join(parts)
+
+
+class EventStreamParser:
+    """
+    Инкрементальный разбор multipart-потока eventManager.cgi. Части потока выглядят так:
+
+        --myboundary
+        Content-Type: text/plain
+        Content-Length: 36
+
+        Code=AlarmLocal;action=Start;index=0
+
+    Часть с Content-Length отдаётся сразу, как только пришло её тело, без ожидания следующей границы.
+    """
+
+    def __init__(self, content_type: str = ""):
+        match = re.search(r'boundary="?([^";]+)"?', content_type)
+        boundary = match.group(1) if match else "myboundary"
+        self._delimiter = b"--" + boundary.removeprefix("--").encode()
+        self._buffer = b""
+
+    def feed(self, chunk: bytes) -> list[dict[str, str]]:
+        self._buffer += chunk
+        events = []
+        while True:
+            start = self._buffer.find(self._delimiter)
+            if start < 0:
+                # Хвост без границы - мусор, но последние байты могут оказаться началом границы
+                self._buffer = self._buffer[-len(self._delimiter):]
+                break
+
+            headers_start = start + len(self._delimiter)
+            headers_end = self._buffer.find(b"\r\n\r\n", headers_start)
+            if headers_end < 0:
+                self._buffer = self._buffer[start:]
+                break
+
+            headers = self._buffer[headers_start:headers_end].decode(errors="ignore")
+            body_start = headers_end + 4
+            length = re.search(r"Content-Length:\s*(\d+)", headers, re.IGNORECASE)
+            if length is not None:
+                body_end = body_start + int(length.group(1))
+                if len(self._buffer) < body_end:
+                    self._buffer = self._buffer[start:]
+                    break
+            else:
+                body_end = self._buffer.find(self._delimiter, body_start)
+                if body_end < 0:
+                    self._buffer = self._buffer[start:]
+                    break
+
+            event = parse_event(self._buffer[body_start:body_end].decode(errors="ignore"))
+            if event:
+                events.append(event)
+            self._buffer = self._buffer[body_end:]
+        return events
+
+
+def parse_event(body: str) -> dict[str, str]:
+    """Разбирает тело события «Code=AlarmLocal;action=Start;index=0» (heartbeat приходит как «Heartbeat»)."""
+    body = body.strip()
+    if body == "Heartbeat":
+        return {"Code": "Heartbeat"}
+    event = {}
+    for item in body.split(";"):
+        key, sep, value = item.partition("=")
+        if sep:
+            event[key.strip()] = value.strip()
+    return event
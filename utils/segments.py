@@ -0,0 +1,177 @@
+import csv
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+from config.config import buffers, SEGMENT_DIR, SEGMENT_WRAP
+
+
+@dataclass(frozen=True, slots=True)
+class Segment:
+    """Закрытый сегмент rolling buffer'а камеры."""
+    path: Path
+    start_pts: float  # Начало сегмента на шкале времени потока ffmpeg, сек.
+    duration: float   # Реальная длительность сегмента, сек.
+    wall_end: float   # Время закрытия сегмента (time.time())
+
+    @property
+    def wall_start(self) -> float:
+        return self.wall_end - self.duration
+
+
+def parse_segment_list_entry(line: str, wall_end: float | None = None) -> Segment | None:
+    """
+    Разбирает строку csv-списка сегментов ffmpeg (-segment_list_type csv):
+    «имя_файла,start_time,end_time».
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        filename, start, end = next(csv.reader([line]))
+        start, end = float(start), float(end)
+    except (ValueError, StopIteration):
+        return None
+
+    return Segment(
+        path=SEGMENT_DIR / filename,
+        start_pts=start,
+        duration=max(end - start, 0.0),
+        wall_end=wall_end if wall_end is not None else time.time(),
+    )
+
+
+def next_segment_path(path: Path) -> Path:
+    """Имя файла, который ffmpeg откроет после закрытия path (с учётом segment_wrap)."""
+    prefix, _, number = path.stem.rpartition("_")
+    return path.with_name(f"{prefix}_{(int(number) + 1) % SEGMENT_WRAP:03d}{path.suffix}")
+
+
+# Длительность GOP потока каждой камеры (сек.), определяется при старте захвата
+capture_gops: dict[int, float] = {}
+
+# Открытые (ещё пишущиеся) сегменты по id камеры. Сегменты пишутся фрагментированным mp4,
+# поэтому уже записанные GOP открытого сегмента можно читать до его закрытия.
+live_segments: dict[int, Segment] = {}
+
+
+def set_live_segment(camera_id: int, closed: Segment) -> None:
+    """Запоминает сегмент, который начал писаться сразу после закрытия closed."""
+    live_segments[camera_id] = Segment(
+        path=next_segment_path(closed.path),
+        start_pts=closed.start_pts + closed.duration,
+        duration=0.0,
+        wall_end=closed.wall_end,
+    )
+
+
+def get_live_segment(camera_id: int, now: float | None = None) -> Segment | None:
+    """Открытый сегмент камеры, длительность которого считается по состоянию на now."""
+    live = live_segments.get(camera_id)
+    if live is None:
+        return None
+    now = now if now is not None else time.time()
+    return Segment(live.path, live.start_pts, max(now - live.wall_end, 0.0), now)
+
+
+def get_buffer_end(camera_id: int) -> float | None:
+    """Самый поздний момент, который есть в буфере камеры: «сейчас», если известен открытый сегмент."""
+    if camera_id in live_segments:
+        return time.time()
+    ring = buffers.get(camera_id)
+    return ring[-1].wall_end if ring else None
+
+
+# Все функции ниже по умолчанию работают с кольцом исходных сегментов (config.buffers),
+# через rings можно передать параллельное кольцо (например, предварительно отрендеренных сегментов).
+def reset_segments(camera_id: int, rings: dict[int, deque] = buffers) -> None:
+    """Сбрасывает индекс камеры (например, при перезапуске ffmpeg - нумерация файлов начинается заново)."""
+    # Файл, в который ffmpeg пишет прямо сейчас, ещё может лежать в кольце под старой записью,
+    # поэтому храним на один сегмент меньше, чем segment_wrap.
+    rings[camera_id] = deque(maxlen=max(SEGMENT_WRAP - 1, 1))
+    if rings is buffers:
+        live_segments.pop(camera_id, None)
+
+
+def register_segment(camera_id: int, segment: Segment, rings: dict[int, deque] = buffers) -> None:
+    if camera_id not in rings:
+        reset_segments(camera_id, rings)
+    rings[camera_id].append(segment)
+
+
+def discard_segment(camera_id: int, path: Path, rings: dict[int, deque] = buffers) -> None:
+    """Убирает из кольца записи о файле, который сейчас будет перезаписан."""
+    ring = rings.get(camera_id)
+    if ring is None:
+        return
+    for segment in [segment for segment in ring if segment.path == path]:
+        ring.remove(segment)
+
+
+def get_segments(camera_id: int, rings: dict[int, deque] = buffers) -> list[Segment]:
+    return list(rings.get(camera_id, ()))
+
+
+def select_segments(camera_id: int, end: float, duration: float,
+                    rings: dict[int, deque] = buffers, live: bool = False) -> tuple[list[Segment], float]:
+    """
+    Выбирает сегменты, покрывающие интервал [end - duration, end] (время - time.time()).
+    При live=True учитывается и открытый сегмент.
+    Возвращает сегменты в хронологическом порядке и смещение начала клипа внутри первого сегмента.
+    """
+    start = end - duration
+    candidates = list(rings.get(camera_id, ()))
+    live_segment = get_live_segment(camera_id) if live else None
+    if live_segment is not None:
+        candidates.append(live_segment)
+
+    selected = []
+    # Кольцо короткое (SEGMENT_WRAP записей), идём от свежих к старым и останавливаемся на первом лишнем
+    for segment in reversed(candidates):
+        if segment.wall_start >= end:
+            continue
+        if segment.wall_end <= start:
+            break
+        selected.append(segment)
+
+    if not selected:
+        return [], 0.0
+
+    selected.reverse()
+    head = max(start - selected[0].wall_start, 0.0)
+    return selected, head
+
+
+@dataclass(frozen=True, slots=True)
+class StreamInfo:
+    """Параметры видеопотока камеры, неизменные в пределах одной сессии захвата."""
+    codec: str
+    width: int
+    height: int
+    fps: float | None = None
+
+    @property
+    def watermark_file(self) -> str:
+        return "media/" + ("watermark_1080.png" if self.height >= 1080 else "watermark_720.png")
+
+
+# Кэш параметров потоков по id камеры, сбрасывается при перезапуске ffmpeg
+stream_infos: dict[int, StreamInfo] = {}
+
+_STREAM_LINE_RE = re.compile(r"Stream #\d+:\d+.*?: Video: (\w+).*?, (\d{2,5})x(\d{2,5})")
+_FPS_RE = re.compile(r"([\d.]+) fps")
+
+
+def parse_stream_info(line: str) -> StreamInfo | None:
+    """
+    Разбирает строку лога ffmpeg с описанием видеопотока, например
+    «Stream #0:0: Video: h264 (Main), yuvj420p(pc), 1920x1080, 25 fps, 25 tbr, 90k tbn».
+    """
+    match = _STREAM_LINE_RE.search(line)
+    if not match:
+        return None
+    codec, width, height = match.groups()
+    fps_match = _FPS_RE.search(line)
+    return StreamInfo(codec, int(width), int(height), float(fps_match.group(1)) if fps_match else None)
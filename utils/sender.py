@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from config.config import TELEGRAM_GLOBAL_RATE, TELEGRAM_PRIVATE_INTERVAL, TELEGRAM_GROUP_INTERVAL, \
+    TELEGRAM_SEND_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitedSender:
+    """
+    Отправка сообщений с учётом лимитов Telegram: не больше global_rate сообщений в секунду на бота
+    и не чаще одного сообщения в private_interval (личные чаты) или group_interval (группы и каналы,
+    у них отрицательный chat_id) секунд в один чат. На TelegramRetryAfter чат и весь бот
+    ставятся на паузу на retry_after секунд, после чего отправка повторяется.
+    """
+
+    def __init__(self, global_rate: float, private_interval: float, group_interval: float, attempts: int = 3):
+        self.global_interval = 1 / global_rate
+        self.private_interval = private_interval
+        self.group_interval = group_interval
+        self.attempts = attempts
+        self._global_next = 0.0
+        self._chat_next: dict[int, float] = {}
+        self._lock: asyncio.Lock | None = None
+
+    async def _acquire(self, chat_id: int) -> None:
+        # Слоты раздаются под блокировкой, а ждать своего слота каждый отправитель уходит без неё
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._global_next, self._chat_next.get(chat_id, 0.0))
+            interval = self.group_interval if chat_id < 0 else self.private_interval
+            self._global_next = slot + self.global_interval
+            self._chat_next[chat_id] = slot + interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def _pause(self, chat_id: int, seconds: float) -> None:
+        resume = time.monotonic() + seconds
+        self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), resume)
+        self._global_next = max(self._global_next, resume)
+
+    async def send(self, chat_id: int, method: Callable[..., Awaitable[Any]], **kwargs) -> Any:
+        """Вызывает метод бота (bot.send_video, bot.send_message, ...) для чата chat_id."""
+        for attempt in range(1, self.attempts + 1):
+            await self._acquire(chat_id)
+            try:
+                return await method(chat_id=chat_id, **kwargs)
+            except TelegramRetryAfter as e:
+                if attempt == self.attempts:
+                    raise
+                logger.warning(f"Чат {chat_id}: лимит Telegram, повтор через {e.retry_after} сек.")
+                self._pause(chat_id, e.retry_after)
+
+
+sender = RateLimitedSender(TELEGRAM_GLOBAL_RATE, TELEGRAM_PRIVATE_INTERVAL, TELEGRAM_GROUP_INTERVAL,
+                           TELEGRAM_SEND_ATTEMPTS)
@@ -23,5 +23,7 @@ right_password_text = """Супер🚀
 make_public_text = f"""Вот ваш хайлайт🤩"""
 
 saving_video_text = "В течение минуты видео появится здесь✅"
+queue_position_text = "Сейчас много сохранений, ваше видео в очереди: {}⏳"
+queue_full_text = "Сервер перегружен, попробуйте сохранить видео через минуту🙏"
 error_text = "Произошла ошибка, обратитесь к администратору"
 public_text = "Видео будет находиться в открытом доступе"
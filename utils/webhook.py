@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import signal
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import TelegramObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config.config import WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET, \
+    WEBHOOK_DRAIN_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class InFlightUpdates(BaseMiddleware):
+    """
+    Считает обновления, которые сейчас обрабатываются. Обработчик вебхука отвечает Telegram сразу
+    и обрабатывает обновление в фоне, поэтому при остановке их нужно дождаться отдельно.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: dict[str, Any]) -> Any:
+        self.count += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+            if self.count == 0:
+                self._idle.set()
+
+    async def wait_idle(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class WebhookRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler, который отвечает 403, а не 401, если X-Telegram-Bot-Api-Secret-Token не совпал."""
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            logger.warning(f"Вебхук: запрос от {request.remote} с неверным секретом")
+            return web.Response(body="Forbidden", status=403)
+        return await super().handle(request)
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """
+    Принимает обновления через вебхук до SIGTERM/SIGINT. При остановке сервер сначала перестаёт принимать
+    новые запросы (Telegram придержит их и доставит после перезапуска), затем ждёт начатые обработчики
+    не дольше WEBHOOK_DRAIN_TIMEOUT и только после этого вызывает shutdown-хэндлеры диспетчера.
+    Вебхук при остановке не удаляется.
+    """
+    in_flight = InFlightUpdates()
+    dp.update.outer_middleware(in_flight)
+
+    app = web.Application()
+    WebhookRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()  # Здесь же выполняются startup-хэндлеры диспетчера
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+
+    await bot.set_webhook(
+        WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(f"Вебхук {WEBHOOK_PATH} слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Остановка вебхука: новые обновления не принимаются")
+        await site.stop()
+        if not await in_flight.wait_idle(WEBHOOK_DRAIN_TIMEOUT):
+            logger.warning(f"Не дождались {in_flight.count} обновлений за {WEBHOOK_DRAIN_TIMEOUT} сек.")
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(sig)
+        await runner.cleanup()  # shutdown-хэндлеры диспетчера
+        await bot.session.close()